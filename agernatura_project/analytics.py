@@ -0,0 +1,304 @@
+import bisect
+import math
+
+import numpy as np
+
+from .batch import PatientBatch
+from .classification import get_engine
+from .fields import GENDERS, PATIENT_FIELDS, PATIENT_METRICS, SCALE_FIELDS, SCALE_METRICS
+from .validation import validate_columns
+
+
+# Age bands of the body fat reference table: "<=20", "21-25", ..., "56+".
+AGE_BAND_EDGES = (20, 25, 30, 35, 40, 45, 50, 55)
+# (low, high, bin width) of every value that gets a histogram and quantiles.
+# Values below/above the range land in an underflow/overflow bin.
+VALUE_BINS = {
+    "basal_metabolic_rate": (0, 6000, 5),
+    "weight": (0, 250, 0.5),
+    "imc": (0, 80, 0.1),
+    "mgras_percent": (0, 70, 0.1),
+    "muscular_mass_kg": (0, 120, 0.1),
+    "visceral_gras": (0, 60, 0.5),
+    "water_levels": (0, 100, 0.1),
+}
+PATIENT_VALUES = ("basal_metabolic_rate", "weight")
+STREAM_CHUNK = 10_000
+
+
+def age_band_labels(edges=AGE_BAND_EDGES):
+    labels = [f"<={edges[0]}"]
+    labels += [f"{low + 1}-{high}" for low, high in zip(edges, edges[1:])]
+    labels.append(f"{edges[-1] + 1}+")
+    return labels
+
+
+class BinnedSketch:
+    """
+    Fixed-bin histogram of one value per group, with exact count, sum, min and
+    max. Memory does not grow with the number of patients, two sketches merge
+    by adding their arrays and quantiles are accurate to one bin width. NaN and
+    infinite values are only counted, in ``nonfinite``.
+    """
+
+    def __init__(self, groups, low, high, width):
+        self.low = low
+        self.high = high
+        self.width = width
+        self.bins = int(round((high - low) / width))
+        # Bin 0 is the underflow, 1..bins the regular bins, bins + 1 the overflow.
+        self.counts = np.zeros((groups, self.bins + 2), dtype=np.int64)
+        self.sums = np.zeros(groups)
+        self.minimums = np.full(groups, np.inf)
+        self.maximums = np.full(groups, -np.inf)
+        self.nonfinite = np.zeros(groups, dtype=np.int64)
+
+    def _bin(self, value):
+        k = math.floor((value - self.low) / self.width)
+        return 0 if k < 0 else self.bins + 1 if k >= self.bins else k + 1
+
+    def add(self, group, value):
+        if not math.isfinite(value):
+            self.nonfinite[group] += 1
+            return
+        self.counts[group, self._bin(value)] += 1
+        self.sums[group] += value
+        if value < self.minimums[group]:
+            self.minimums[group] = value
+        if value > self.maximums[group]:
+            self.maximums[group] = value
+
+    def add_many(self, groups, values):
+        finite = np.isfinite(values)
+        if not finite.all():
+            self.nonfinite += np.bincount(groups[~finite], minlength=len(self.nonfinite))
+            groups = groups[finite]
+            values = values[finite]
+        k = np.floor((values - self.low) / self.width)
+        bins = np.where(k < 0, 0, np.where(k >= self.bins, self.bins + 1, k + 1)).astype(np.intp)
+        size = self.counts.shape[1]
+        self.counts += np.bincount(groups * size + bins, minlength=self.counts.size).reshape(self.counts.shape)
+        self.sums += np.bincount(groups, weights=values, minlength=len(self.sums))
+        np.minimum.at(self.minimums, groups, values)
+        np.maximum.at(self.maximums, groups, values)
+
+    def merge(self, other):
+        if (self.low, self.high, self.width, self.counts.shape) != (other.low, other.high, other.width, other.counts.shape):
+            raise ValueError("Only sketches with the same bins can be merged.")
+        self.counts += other.counts
+        self.sums += other.sums
+        np.minimum(self.minimums, other.minimums, out=self.minimums)
+        np.maximum(self.maximums, other.maximums, out=self.maximums)
+        self.nonfinite += other.nonfinite
+        return self
+
+    def edges(self):
+        return self.low + self.width * np.arange(self.bins + 1)
+
+    def quantiles(self, fractions, groups):
+        counts = self.counts[groups].sum(axis=0)
+        total = counts.sum()
+        if not total:
+            return [None] * len(fractions)
+        low = self.minimums[groups].min()
+        high = self.maximums[groups].max()
+        # Lower and upper edge of every bin, the outer bins bounded by min/max.
+        lower = np.concatenate(([low], self.edges()))
+        upper = np.concatenate((self.edges(), [high]))
+        cumulative = np.cumsum(counts)
+        results = []
+        for fraction in fractions:
+            rank = fraction * total
+            index = min(int(np.searchsorted(cumulative, rank, side='left')), len(counts) - 1)
+            before = cumulative[index] - counts[index]
+            position = (rank - before) / counts[index] if counts[index] else 0.0
+            value = lower[index] + position * (upper[index] - lower[index])
+            results.append(float(min(max(value, low), high)))
+        return results
+
+
+class CohortAnalytics:
+    """
+    Clinic-wide statistics over a stream of patients, in fixed memory: category
+    count tables for every classifier and binned sketches (histograms and
+    quantiles) of the main values, all grouped by gender and age band. Results
+    of parallel workers are combined with merge().
+    """
+
+    def __init__(self, age_band_edges=AGE_BAND_EDGES, value_bins=None):
+        self.age_band_edges = tuple(age_band_edges)
+        self.age_bands = age_band_labels(self.age_band_edges)
+        self.value_bins = dict(VALUE_BINS if value_bins is None else value_bins)
+        groups = len(GENDERS) * len(self.age_bands)
+        self.patients = np.zeros(groups, dtype=np.int64)
+        self.rejected = 0
+        self.categories = {
+            metric: np.zeros((groups, len(get_engine().labels(metric))), dtype=np.int64)
+            for metric in PATIENT_METRICS + SCALE_METRICS
+        }
+        self.sketches = {value: BinnedSketch(groups, *spec) for value, spec in self.value_bins.items()}
+
+    def _group(self, gender, age):
+        band = bisect.bisect_left(self.age_band_edges, age)
+        return GENDERS.index(gender) * len(self.age_bands) + band
+
+    def update(self, patient):
+        """
+        Add one Patient or ScalePatient.
+        """
+        group = self._group(patient.gender, patient.age)
+        has_scale_data = hasattr(patient, "water_levels")
+        metrics = PATIENT_METRICS + SCALE_METRICS if has_scale_data else PATIENT_METRICS
+        # Everything that can fail runs before any counter changes.
+        codes = [patient.category_code(metric) for metric in metrics]
+        values = {}
+        for value in self.sketches:
+            if value == "basal_metabolic_rate":
+                values[value] = patient.basal_metabolic_rate()
+            elif has_scale_data or value in PATIENT_VALUES:
+                values[value] = float(getattr(patient, value))
+        self.patients[group] += 1
+        for metric, code in zip(metrics, codes):
+            self.categories[metric][group, code] += 1
+        for value, number in values.items():
+            self.sketches[value].add(group, number)
+
+    def update_batch(self, batch):
+        """
+        Add every row of a PatientBatch with vectorized classification and binning.
+        """
+        if not len(batch):
+            return
+        bands = np.searchsorted(np.asarray(self.age_band_edges), batch.age, side='left')
+        groups = batch.gender.astype(np.intp) * len(self.age_bands) + bands
+        metrics = PATIENT_METRICS + SCALE_METRICS if batch.has_scale_data else PATIENT_METRICS
+        codes = {metric: batch.classify(metric) for metric in metrics}
+        values = {}
+        for value in self.sketches:
+            if value == "basal_metabolic_rate":
+                values[value] = batch.get_basal_metabolic_rate()
+            elif batch.has_scale_data or value in PATIENT_VALUES:
+                values[value] = np.asarray(getattr(batch, value), dtype=np.float64)
+        size = len(self.patients)
+        self.patients += np.bincount(groups, minlength=size)
+        for metric, metric_codes in codes.items():
+            table = self.categories[metric]
+            flat = groups * table.shape[1] + metric_codes
+            table += np.bincount(flat, minlength=table.size).reshape(table.shape)
+        for value, numbers in values.items():
+            self.sketches[value].add_many(groups, numbers)
+
+    def update_readings(self, readings):
+        """
+        Add a list of reading dicts (keyed by the Patient/ScalePatient argument
+        names). Invalid readings are validated out and counted in ``rejected``.
+        """
+        if not readings:
+            return
+        fields = PATIENT_FIELDS + SCALE_FIELDS
+        if not all(field in readings[0] for field in SCALE_FIELDS):
+            fields = PATIENT_FIELDS
+        columns = {field: [reading.get(field) for reading in readings] for field in fields}
+        result = validate_columns(columns)
+        self.rejected += len(result) - result.valid_count
+        self.update_batch(result.to_batch())
+
+    def consume(self, stream, chunk_size=STREAM_CHUNK):
+        """
+        Add patients or reading dicts from any iterable, ``chunk_size`` at a time,
+        so the stream is never held in memory. Returns self.
+        """
+        chunk = []
+        for item in stream:
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                self._consume_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._consume_chunk(chunk)
+        return self
+
+    def _consume_chunk(self, chunk):
+        readings = [item for item in chunk if isinstance(item, dict)]
+        patients = [item for item in chunk if not isinstance(item, dict)]
+        if readings:
+            self.update_readings(readings)
+        scale = [p for p in patients if hasattr(p, "water_levels")]
+        plain = [p for p in patients if not hasattr(p, "water_levels")]
+        for group in (scale, plain):
+            if group:
+                self.update_batch(PatientBatch.from_patients(group))
+
+    def merge(self, other):
+        """
+        Add the counts of another CohortAnalytics with the same configuration. Returns self.
+        """
+        if (self.age_band_edges, self.value_bins) != (other.age_band_edges, other.value_bins):
+            raise ValueError("Only analytics with the same age bands and value bins can be merged.")
+        self.patients += other.patients
+        self.rejected += other.rejected
+        for metric, table in self.categories.items():
+            table += other.categories[metric]
+        for value, sketch in self.sketches.items():
+            sketch.merge(other.sketches[value])
+        return self
+
+    def _groups(self, gender=None, age_band=None):
+        genders = range(len(GENDERS)) if gender is None else [GENDERS.index(gender)]
+        if age_band is None:
+            bands = range(len(self.age_bands))
+        else:
+            bands = [self.age_bands.index(age_band) if isinstance(age_band, str) else age_band]
+        return [g * len(self.age_bands) + b for g in genders for b in bands]
+
+    def count(self, gender=None, age_band=None):
+        return int(self.patients[self._groups(gender, age_band)].sum())
+
+    def distribution(self, metric, gender=None, age_band=None):
+        """
+        {label: count} of one classifier.
+        """
+        counts = self.categories[metric][self._groups(gender, age_band)].sum(axis=0)
+        return dict(zip(get_engine().labels(metric), counts.tolist()))
+
+    def share(self, metric, label, gender=None, age_band=None):
+        """
+        Fraction of the classified patients with ``label``, e.g.
+        share("cardiovascular_risk", "Muy elevado").
+        """
+        distribution = self.distribution(metric, gender, age_band)
+        total = sum(distribution.values())
+        return distribution[label] / total if total else None
+
+    def histogram(self, value, gender=None, age_band=None):
+        """
+        (counts, edges) like numpy.histogram, plus the underflow and overflow
+        counts as the first and last entries of ``counts``.
+        """
+        sketch = self.sketches[value]
+        return sketch.counts[self._groups(gender, age_band)].sum(axis=0), sketch.edges()
+
+    def quantiles(self, value, fractions=(0.25, 0.5, 0.75), gender=None, age_band=None):
+        return self.sketches[value].quantiles(fractions, self._groups(gender, age_band))
+
+    def mean(self, value, gender=None, age_band=None):
+        groups = self._groups(gender, age_band)
+        sketch = self.sketches[value]
+        total = sketch.counts[groups].sum()
+        return float(sketch.sums[groups].sum() / total) if total else None
+
+    def nonfinite(self, value, gender=None, age_band=None):
+        """
+        Patients whose ``value`` was NaN or infinite and is left out of its sketch.
+        """
+        return int(self.sketches[value].nonfinite[self._groups(gender, age_band)].sum())
+
+    def quantiles_by_group(self, value, fractions=(0.25, 0.5, 0.75)):
+        """
+        {(gender, age band): quantiles} for every group with patients.
+        """
+        return {
+            (gender, band): self.quantiles(value, fractions, gender, band)
+            for gender in GENDERS for band in self.age_bands if self.count(gender, band)
+        }
+
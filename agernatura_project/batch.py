@@ -0,0 +1,217 @@
+import numpy as np
+
+from .classification import get_engine
+from .fields import ACTIVITY_ALIASES, ACTIVITY_LEVELS, GENDERS, PATIENT_FIELDS, SCALE_FIELDS
+
+
+ACTIVITY_FACTORS = np.array([1.2, 1.375, 1.55, 1.725, 1.9])
+
+# The *_LABELS names are looked up in the active reference tables on every
+# access (see __getattr__), so they follow load_reference_tables.
+LABEL_METRICS = {
+    "CARDIOVASCULAR_RISK_LABELS": "cardiovascular_risk",
+    "COMPLEXION_LABELS": "complexion",
+    "IMC_STANDARD_LABELS": "imc_standard",
+    "MGRAS_PERCENT_LABELS": "mgras_percent",
+    "W_LEVEL_LABELS": "w_level",
+    "IM_MUSCULAR_LABELS": "im_muscular",
+    "EV_GV_LABELS": "ev_gv",
+}
+
+CODE_DTYPE = np.int8
+
+
+def _encode(values, choices, aliases=None):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.uint8, copy=False)
+    lookup = {choice: code for code, choice in enumerate(choices)}
+    if aliases:
+        lookup.update(aliases)
+    try:
+        return np.array([lookup[str(value).lower()] for value in values], dtype=np.uint8)
+    except KeyError as e:
+        raise ValueError(f"{e.args[0]} is not one of {list(choices)}") from None
+
+
+def _search(edges, values):
+    return np.searchsorted(np.asarray(edges, dtype=np.float64), values, side='right')
+
+
+class StringColumn:
+    """
+    Read-only column of strings stored as one UTF-8 blob plus an array of
+    ``len + 1`` byte offsets. Strings are only decoded when indexed.
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(value).encode('utf-8') for value in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def tolist(self):
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def _strings(values):
+    return values if isinstance(values, StringColumn) else np.asarray(values, dtype=object)
+
+
+def __getattr__(name):
+    if name in LABEL_METRICS:
+        return get_engine().labels(LABEL_METRICS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def labels(codes, category_labels):
+    """
+    Map an array of category codes back to its label strings. ``category_labels``
+    is a label sequence or a metric name, whose labels are then read from the
+    active reference tables.
+    """
+    if isinstance(category_labels, str):
+        category_labels = get_engine().labels(category_labels)
+    return np.asarray(category_labels, dtype=object)[codes]
+
+
+class PatientBatch:
+    """
+    Columnar cohort of patients. Every field of Patient/ScalePatient is held as a
+    NumPy column and every classifier returns an array of category codes.
+    """
+
+    def __init__(self, name, surname, age, gender, height, weight, activity, waist_circunference,
+                 mgras_percent=None, bone_mass=None, muscular_mass_kg=None, imc=None,
+                 metabolic_age=None, visceral_gras=None, water_levels=None):
+        self.name = _strings(name)
+        self.surname = _strings(surname)
+        self.age = np.asarray(age, dtype=np.int64)
+        self.gender = _encode(gender, GENDERS)
+        self.height = np.asarray(height, dtype=np.float64)
+        self.weight = np.asarray(weight, dtype=np.float64)
+        self.activity = _encode(activity, ACTIVITY_LEVELS, ACTIVITY_ALIASES)
+        self.waist_circunference = np.asarray(waist_circunference, dtype=np.float64)
+
+        scale_values = (mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age, visceral_gras, water_levels)
+        self.has_scale_data = all(value is not None for value in scale_values)
+        for field, value in zip(SCALE_FIELDS, scale_values):
+            setattr(self, field, None if value is None else np.asarray(value, dtype=np.float64))
+
+    @classmethod
+    def from_patients(cls, patients):
+        patients = list(patients)
+        columns = {field: [getattr(p, field) for p in patients] for field in PATIENT_FIELDS}
+        if patients and all(hasattr(p, "water_levels") for p in patients):
+            for field in SCALE_FIELDS:
+                columns[field] = [getattr(p, field) for p in patients]
+        return cls(**columns)
+
+    def __len__(self):
+        return len(self.age)
+
+    def _require_scale_data(self):
+        if not self.has_scale_data:
+            raise ValueError("This batch has no scale readings, build it from ScalePatient data.")
+
+    def _is_woman(self):
+        return self.gender == GENDERS.index("m")
+
+    def get_basal_metabolic_rate(self):
+        woman = self._is_woman()
+        bmr = np.where(
+            woman,
+            655 + (9.6 * self.weight) + (1.8 * self.height) - (4.7 * self.age),
+            66 + (13.7 * self.weight) + (5 * self.height) - (6.8 * self.age),
+        )
+        return bmr * ACTIVITY_FACTORS[self.activity]
+
+    def classify(self, metric):
+        """
+        Category codes of ``metric`` for every row, looked up with
+        numpy.searchsorted over the same compiled tables ScalePatient uses.
+        """
+        table = get_engine().table(metric)
+        values = getattr(self, table.value)
+        if values is None:
+            self._require_scale_data()
+        band_values = getattr(self, table.band_by) if table.band_by else None
+        codes = np.empty(len(self), dtype=CODE_DTYPE)
+
+        for gender_code, gender in enumerate(GENDERS):
+            rows = np.flatnonzero(self.gender == gender_code)
+            if not len(rows):
+                continue
+            group = table.group(gender)
+            if table.band_by:
+                slots = _search(group.band_edges, band_values[rows])
+                bands = np.asarray(group.slot_bands)[slots]
+            else:
+                bands = np.zeros(len(rows), dtype=np.intp)
+
+            for band, edges in enumerate(group.cutoff_edges):
+                in_band = rows[bands == band]
+                codes[in_band] = _search(edges, values[in_band])
+            outside = rows[bands < 0]
+            if len(outside):
+                if table.fallback is None:
+                    raise ValueError(f"{band_values[outside[0]]} is outside the reference bands of {metric}")
+                codes[outside] = table.fallback_code
+        return codes
+
+    def get_cardiovascular_risk(self):
+        return self.classify("cardiovascular_risk")
+
+    def get_complexion(self):
+        return self.classify("complexion")
+
+    def get_imc_standard(self):
+        return self.classify("imc_standard")
+
+    def get_mgras_percent(self):
+        return self.classify("mgras_percent")
+
+    def get_w_level(self):
+        return self.classify("w_level")
+
+    def get_im_muscular(self):
+        return self.classify("im_muscular")
+
+    def get_ev_gv(self):
+        return self.classify("ev_gv")
+
+    def classify_all(self):
+        results = {
+            "basal_metabolic_rate": self.get_basal_metabolic_rate(),
+            "cardiovascular_risk": self.get_cardiovascular_risk(),
+            "complexion": self.get_complexion(),
+        }
+        if self.has_scale_data:
+            results.update({
+                "imc_standard": self.get_imc_standard(),
+                "mgras_percent": self.get_mgras_percent(),
+                "w_level": self.get_w_level(),
+                "im_muscular": self.get_im_muscular(),
+                "ev_gv": self.get_ev_gv(),
+            })
+        return results
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+MAX_BYTES = 256 << 20
+# Eviction trims the cache to this fraction of max_bytes so a full cache does
+# not rescan its directory on every store.
+LOW_WATER = 0.9
+
+
+def chart_key(kind, values, label, format, dpi, style_version):
+    """
+    Content address of one chart: sha256 of everything that changes its pixels.
+    """
+    text = "\x1f".join([kind, ",".join(repr(float(value)) for value in values), "\x1e".join(label),
+                        format, str(dpi), str(style_version)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ChartCache:
+    """
+    On-disk cache of rendered charts, one file per content address under
+    ``directory``. A hit refreshes the file's modification time, and when the
+    files add up to more than ``max_bytes`` the least recently used ones are
+    deleted. Several processes can share a directory: files are written to a
+    temporary name and renamed into place.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = self._read_size()
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.is_file() and not entry.name.startswith('.')]
+
+    def _stats(self):
+        """
+        (stat, path) of every cached chart. Files another process deletes
+        between the scan and the stat are left out.
+        """
+        stats = []
+        for entry in self._entries():
+            try:
+                stats.append((entry.stat(), entry.path))
+            except FileNotFoundError:
+                pass
+        return stats
+
+    def _read_size(self):
+        # Other processes sharing the directory store and evict charts too, so
+        # the running size of this one is only an estimate between scans.
+        return sum(stat.st_size for stat, _ in self._stats())
+
+    def path(self, key, format):
+        return os.path.join(self.directory, f"{key}.{format}")
+
+    def lookup(self, key, format):
+        """
+        Path of the cached chart, or None. Counts a hit or a miss.
+        """
+        path = self.path(key, format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, key, format, data):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        path = self.path(key, format)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(temporary, path)
+        self.size += len(data) - replaced
+        if self.size > self.max_bytes:
+            self.evict()
+        return path
+
+    def evict(self):
+        """
+        Delete least recently used charts until the cache is under its low water mark.
+        """
+        entries = sorted(self._stats(), key=lambda item: item[0].st_mtime_ns)
+        self.size = sum(stat.st_size for stat, _ in entries)
+        target = self.max_bytes * LOW_WATER
+        for stat, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= stat.st_size
+            self.evictions += 1
+
+    def clear(self):
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+    def stats(self):
+        self.size = self._read_size()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "bytes": self.size,
+        }
+
+    def add_stats(self, stats):
+        """
+        Fold in the counters of a copy of this cache used in another process.
+        Its bytes are not added: both copies store into the same directory, so
+        the size is read from it again.
+        """
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+        self.evictions += stats["evictions"]
+        self.size = self._read_size()
+
+
+def copy_cached(path, target):
+    """
+    Serve a cached chart to a render target: bytes when ``target`` is None,
+    otherwise the path or file-like ``target``.
+    """
+    if target is None:
+        with open(path, 'rb') as file:
+            return file.read()
+    if isinstance(target, (str, os.PathLike)):
+        shutil.copyfile(path, target)
+        return target
+    with open(path, 'rb') as file:
+        shutil.copyfileobj(file, target)
+    return target
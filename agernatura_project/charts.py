@@ -0,0 +1,495 @@
+import io
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from .chart_cache import ChartCache, chart_key, copy_cached
+from .instrumentation import instrumented
+
+
+CHART_SPECS = {
+    "imc": {
+        "attribute": "imc",
+        "limits": [0, 18.5, 25, 30, 35, 50, 60],
+        "colors": ['#E0E0E0', '#7FFF7F', 'yellow', 'orange', '#FF9999', 'red'],
+        "labels": ['Bajo peso', 'Peso normal', 'Sobrepeso', 'Obesidad I', 'Obesidad II', 'Obesidad III'],
+        "xlim": (0, 60),
+        "xticks": [10, 20, 30, 40, 50, 60],
+        "xlabel": "IMC",
+        "title": "Barra de IMC",
+        "cohort_bins": 120,
+    },
+    "gc": {
+        "attribute": "mgras_percent",
+        "limits": [0, 23, 35, 41, 50],
+        "colors": ["#E0E0E0", "#7FFF7F", "yellow", "#FF9999"],
+        "labels": ["Bajo grasa", "saludable", "alto grasa", "obeso"],
+        "xlim": (0, 50),
+        "xticks": [10, 20, 30, 40, 50],
+        "xlabel": "% Grasa Corporal",
+        "title": "% Grasa Corporal",
+        "cohort_bins": 100,
+    },
+    "wl": {
+        "attribute": "water_levels",
+        "limits": [0, 44, 66, 80],
+        "colors": ["#E0E0E0", "#7FFF7F", "#E0E0E0"],
+        "labels": ["Bajo", "saludable", "Alto"],
+        "xlim": (30, 80),
+        "xticks": [30, 45, 50, 60, 65, 80],
+        "xlabel": "% Agua Corporal",
+        "title": "% Agua Corporal",
+        "cohort_bins": 100,
+    },
+    "cvrisk": {
+        "attribute": "visceral_gras",
+        "limits": [0, 5, 9, 13, 17, 21],
+        "colors": ["#7FFF7F", "yellow", "orange", "#FF9999", "red"],
+        "labels": ["Ninguno", "Aumentado", "Alto", "Muy alto", "Extremo"],
+        "xlim": (0, 21),
+        "xticks": [],
+        "xlabel": "Riesgo Cardiovascular",
+        "title": "Riesgo Cardiovascular",
+        "cohort_bins": 21,
+    },
+}
+CHART_KINDS = tuple(CHART_SPECS)
+FIGSIZE = (6, 3)
+DASHBOARD = "dashboard"
+DASHBOARD_FIGSIZE = (6, 10)
+PNG_COMPRESS_LEVEL = 1
+# Part of every chart cache key: bump it whenever a change here alters how
+# charts look, so cached images drawn with the old style are not served.
+STYLE_VERSION = 1
+# The cohort strip is drawn above the bands, from COHORT_BASELINE to the top of
+# the axes (ylim is -1, 1).
+COHORT_BASELINE = 0.3
+COHORT_HEIGHT = 0.65
+COHORT_COLOR = '#1F4E79'
+
+
+def chart_title(kind, name, surname):
+    return f"{CHART_SPECS[kind]['title']}: '{name} {surname}'"
+
+
+def draw_bands(ax, kind):
+    """
+    Draw the static part of a gauge: colour bands, axes and legend.
+    """
+    spec = CHART_SPECS[kind]
+    limits = spec["limits"]
+    for i in range(len(limits) - 1):
+        ax.barh(0, limits[i + 1] - limits[i], left=limits[i], height=0.5,
+                color=spec["colors"][i], edgecolor='black', label=spec["labels"][i])
+
+    ax.set_xlim(*spec["xlim"])
+    ax.set_ylim(-1, 1)
+    ax.set_xticks(spec["xticks"])
+    ax.set_yticks([])
+    ax.set_xlabel(spec["xlabel"])
+    ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+
+
+def draw_gauge(ax, kind, value, name, surname):
+    """
+    Draw a full gauge for one patient and return its (marker, label, title) artists
+    so templates can move them to the next patient.
+    """
+    draw_bands(ax, kind)
+    marker = ax.scatter(value, 0, color='white', marker='o', s=50, edgecolor='black')
+    label = ax.text(value, 0.18, f'{name}', ha='center', va='center', color='black', fontsize=10,
+                    bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.3'))
+    title = ax.set_title(chart_title(kind, name, surname))
+    return marker, label, title
+
+
+def cohort_title(kind, count):
+    return f"{CHART_SPECS[kind]['title']}: {count} pacientes"
+
+
+def cohort_values(cohort, kind):
+    """
+    The plotted column of ``cohort``: a PatientBatch (or anything with the
+    chart's attribute) or an array of values.
+    """
+    attribute = CHART_SPECS[kind]["attribute"]
+    values = getattr(cohort, attribute, cohort)
+    if values is None:
+        raise ValueError(f"The cohort has no {attribute} values, build it from ScalePatient data.")
+    return np.asarray(values, dtype=np.float64)
+
+
+def cohort_histogram(kind, values):
+    """
+    (heights, edges, count) of the strip drawn over the bands. Values outside
+    the chart's x range are counted in the end bins (NaN ones are dropped) and
+    the tallest bin reaches the top of the axes, so the strip costs the same to
+    draw for any cohort size.
+    """
+    spec = CHART_SPECS[kind]
+    low, high = spec["xlim"]
+    bins = spec["cohort_bins"]
+    # Equal-width bins, so the bin of each value is arithmetic: one pass with
+    # bincount instead of np.histogram's clip and search.
+    index = (values - low) * (bins / (high - low))
+    np.clip(index, 0, bins - 1, out=index)
+    index = index[~np.isnan(index)].astype(np.intp)
+    counts = np.bincount(index, minlength=bins)
+    peak = counts.max() or 1
+    return COHORT_BASELINE + COHORT_HEIGHT * counts / peak, np.linspace(low, high, bins + 1), len(index)
+
+
+def draw_cohort(ax, kind, values):
+    """
+    Draw a gauge with the distribution of a whole cohort over its bands and
+    return the (strip, title) artists.
+    """
+    draw_bands(ax, kind)
+    heights, edges, count = cohort_histogram(kind, cohort_values(values, kind))
+    strip = ax.stairs(heights, edges, baseline=COHORT_BASELINE, fill=True, color=COHORT_COLOR, alpha=0.8)
+    title = ax.set_title(cohort_title(kind, count))
+    return strip, title
+
+
+def draw_dashboard(figure, axes, patient):
+    """
+    Draw the four gauges of ``patient`` on ``axes`` (one per CHART_KINDS entry)
+    and return the (markers, labels, suptitle) artists.
+    """
+    markers = []
+    labels = []
+    for ax, kind in zip(axes, CHART_KINDS):
+        value = getattr(patient, CHART_SPECS[kind]["attribute"])
+        marker, label, title = draw_gauge(ax, kind, value, patient.name, patient.surname)
+        title.set_text(CHART_SPECS[kind]["title"])
+        markers.append(marker)
+        labels.append(label)
+    suptitle = figure.suptitle(f"{patient.name} {patient.surname}")
+    return markers, labels, suptitle
+
+
+def _target_format(target, format):
+    if format is None and isinstance(target, (str, os.PathLike)):
+        format = os.path.splitext(os.fspath(target))[1].lstrip('.') or None
+    return (format or 'png').lower()
+
+
+def _write(target, write):
+    if target is None:
+        buffer = io.BytesIO()
+        write(buffer)
+        return buffer.getvalue()
+    write(target)
+    return target
+
+
+def _write_bytes(target, data):
+    if target is None:
+        return data
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as file:
+            file.write(data)
+    else:
+        target.write(data)
+    return target
+
+
+class FigureTemplate:
+    """
+    A headless Agg figure whose static artists are rasterized once. Artists
+    passed to ``set_dynamic`` are left out of that background and redrawn on
+    top of it for every PNG, so only they cost time per render.
+    """
+
+    def __init__(self, figsize, dpi):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.dynamic = []
+        self.background = None
+
+    def set_dynamic(self, artists):
+        self.dynamic = list(artists)
+        for artist in self.dynamic:
+            artist.set_animated(True)
+
+    def freeze(self):
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def save(self, target=None, format=None):
+        format = _target_format(target, format)
+        if format == 'png':
+            return _write(target, self._save_png)
+
+        for artist in self.dynamic:
+            artist.set_animated(False)
+        try:
+            return _write(target, lambda out: self.figure.savefig(out, format=format))
+        finally:
+            for artist in self.dynamic:
+                artist.set_animated(True)
+
+    def _save_png(self, out):
+        self.canvas.restore_region(self.background)
+        for artist in self.dynamic:
+            self.figure.draw_artist(artist)
+        width, height = self.canvas.get_width_height()
+        image = Image.frombuffer('RGBA', (width, height), self.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        image.save(out, format='png', compress_level=PNG_COMPRESS_LEVEL)
+
+
+class ChartTemplate(FigureTemplate):
+    """
+    Reusable figure for one chart type: bands, axes, legend and layout are
+    built once, render() only moves the patient marker, label and title.
+    """
+
+    def __init__(self, kind, dpi=100):
+        super().__init__(FIGSIZE, dpi)
+        self.kind = kind
+        self.attribute = CHART_SPECS[kind]["attribute"]
+        ax = self.figure.add_subplot()
+        start = CHART_SPECS[kind]["xlim"][0]
+        self.marker, self.label, self.title = draw_gauge(ax, kind, start, "", "")
+        self.set_dynamic((self.marker, self.label, self.title))
+        self.figure.tight_layout()
+        self.freeze()
+
+    def update(self, patient):
+        value = getattr(patient, self.attribute)
+        self.marker.set_offsets([[value, 0]])
+        self.label.set_position((value, 0.18))
+        self.label.set_text(f'{patient.name}')
+        self.title.set_text(chart_title(self.kind, patient.name, patient.surname))
+
+    def render(self, patient, target=None, format=None):
+        """
+        Write the chart of ``patient`` to a path or file-like ``target`` (format
+        taken from the extension unless given) or return the PNG/SVG bytes
+        when ``target`` is None.
+        """
+        self.update(patient)
+        return self.save(target, format)
+
+
+class CohortTemplate(FigureTemplate):
+    """
+    Reusable figure for the cohort version of one chart type: render() only
+    replaces the histogram strip and the title.
+    """
+
+    def __init__(self, kind, dpi=100):
+        super().__init__(FIGSIZE, dpi)
+        self.kind = kind
+        ax = self.figure.add_subplot()
+        self.strip, self.title = draw_cohort(ax, kind, np.empty(0))
+        self.set_dynamic((self.strip, self.title))
+        self.figure.tight_layout()
+        self.freeze()
+
+    def update(self, cohort):
+        heights, edges, count = cohort_histogram(self.kind, cohort_values(cohort, self.kind))
+        self.strip.set_data(heights, edges)
+        self.title.set_text(cohort_title(self.kind, count))
+
+    def render(self, cohort, target=None, format=None):
+        self.update(cohort)
+        return self.save(target, format)
+
+
+class _Placeholder:
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class DashboardTemplate(FigureTemplate):
+    """
+    Reusable single figure with the four gauges as subplots. The layout is
+    computed once; render() only moves the four markers and labels and
+    retitles the figure.
+    """
+
+    kind = DASHBOARD
+
+    def __init__(self, dpi=100):
+        super().__init__(DASHBOARD_FIGSIZE, dpi)
+        axes = self.figure.subplots(len(CHART_KINDS), 1)
+        placeholder = _Placeholder(name="", surname="", **{
+            spec["attribute"]: spec["xlim"][0] for spec in CHART_SPECS.values()
+        })
+        self.markers, self.labels, self.title = draw_dashboard(self.figure, axes, placeholder)
+        self.set_dynamic(self.markers + self.labels + [self.title])
+        self.figure.tight_layout()
+        self.freeze()
+
+    def update(self, patient):
+        for kind, marker, label in zip(CHART_KINDS, self.markers, self.labels):
+            value = getattr(patient, CHART_SPECS[kind]["attribute"])
+            marker.set_offsets([[value, 0]])
+            label.set_position((value, 0.18))
+            label.set_text(f'{patient.name}')
+        self.title.set_text(f"{patient.name} {patient.surname}")
+
+    def render(self, patient, target=None, format=None):
+        self.update(patient)
+        return self.save(target, format)
+
+
+class ChartRenderer:
+    """
+    Non-interactive renderer that keeps one warmed-up ChartTemplate per chart type.
+
+    With a ChartCache every chart is looked up by the hash of its type, plotted
+    values, patient name, format, dpi and STYLE_VERSION first, and hits are
+    copied from disk without drawing anything.
+    """
+
+    def __init__(self, dpi=100, cache=None):
+        self.dpi = dpi
+        self.cache = cache
+        self.templates = {}
+        self.unnamed = 0
+
+    def template(self, kind):
+        if kind not in self.templates:
+            if kind == DASHBOARD:
+                self.templates[kind] = DashboardTemplate(self.dpi)
+            elif kind in CHART_SPECS:
+                self.templates[kind] = ChartTemplate(kind, self.dpi)
+            else:
+                raise ValueError(f"{kind} invalid, must be in {list(CHART_KINDS) + [DASHBOARD]}")
+        return self.templates[kind]
+
+    def cohort_template(self, kind):
+        if kind not in CHART_SPECS:
+            raise ValueError(f"{kind} invalid, must be in {list(CHART_KINDS)}")
+        key = ("cohort", kind)
+        if key not in self.templates:
+            self.templates[key] = CohortTemplate(kind, self.dpi)
+        return self.templates[key]
+
+    def cache_key(self, patient, kind, format):
+        kinds = CHART_KINDS if kind == DASHBOARD else (kind,)
+        values = [getattr(patient, CHART_SPECS[k]["attribute"]) for k in kinds]
+        return chart_key(kind, values, (patient.name, patient.surname), format, self.dpi, STYLE_VERSION)
+
+    @instrumented("ChartRenderer.render")
+    def render(self, patient, kind, target=None, format=None):
+        if self.cache is None:
+            return self.template(kind).render(patient, target, format)
+
+        format = _target_format(target, format)
+        key = self.cache_key(patient, kind, format)
+        path = self.cache.lookup(key, format)
+        if path is not None:
+            try:
+                return copy_cached(path, target)
+            except FileNotFoundError:
+                # Evicted by another process between the lookup and the copy.
+                pass
+        data = self.template(kind).render(patient, None, format)
+        self.cache.store(key, format, data)
+        return _write_bytes(target, data)
+
+    @instrumented("ChartRenderer.render_cohort")
+    def render_cohort(self, cohort, kind, target=None, format=None):
+        """
+        Chart of where a whole cohort (a PatientBatch or an array of values)
+        falls on the ``kind`` bands, written like render().
+        """
+        return self.cohort_template(kind).render(cohort, target, format)
+
+    def render_dashboard(self, patient, target=None, format=None):
+        return self.render(patient, DASHBOARD, target, format)
+
+    def render_all(self, patient, directory=None, format='png', kinds=CHART_KINDS, stem=None):
+        """
+        Render every chart of ``patient``. Returns {kind: bytes}, or
+        {kind: path} when a directory is given. Files are named
+        ``<stem>_<kind>.<format>``; ``stem`` defaults to the patient_id, or for
+        patients without one to the name plus a counter of this renderer, so
+        namesakes do not overwrite each other.
+        """
+        if directory is not None and stem is None:
+            stem = getattr(patient, 'patient_id', None)
+            if not stem:
+                self.unnamed += 1
+                stem = f"{patient.name}_{self.unnamed}"
+        results = {}
+        for kind in kinds:
+            target = None
+            if directory is not None:
+                target = os.path.join(directory, f"{stem}_{kind}.{format}")
+            results[kind] = self.render(patient, kind, target, format)
+        return results
+
+
+_worker_renderer = None
+
+
+def _init_worker(dpi, kinds, cache_directory, cache_max_bytes):
+    global _worker_renderer
+    cache = None
+    if cache_directory is not None:
+        cache = ChartCache(cache_directory, cache_max_bytes)
+    _worker_renderer = ChartRenderer(dpi, cache)
+    for kind in kinds:
+        _worker_renderer.template(kind)
+
+
+def _render_job(index, patient, directory, format, kinds):
+    # Input order numbers the patients without a patient_id, whichever worker renders them.
+    stem = getattr(patient, 'patient_id', None) or f"{patient.name}_{index + 1}"
+    result = _worker_renderer.render_all(patient, directory, format, kinds, stem)
+    cache = _worker_renderer.cache
+    if cache is None:
+        return index, result, None
+    stats = cache.stats()
+    cache.hits = cache.misses = cache.evictions = 0
+    return index, result, stats
+
+
+def render_reports(patients, directory=None, format='png', kinds=CHART_KINDS, max_workers=None,
+                   progress=None, dpi=100, cache=None):
+    """
+    Render the charts of many patients across a process pool. ``patients`` is an
+    iterable of ScalePatient or the path of a CSV with scale columns. Each worker
+    warms up its own templates once. Returns one render_all() result per patient
+    in input order. ``progress(done, total)`` is called as patients finish
+    (``total`` is None when the input has no length), and at most ``max_workers``
+    processes run at the same time. With a ChartCache the workers share its
+    directory and their hit/miss counters are added to ``cache``.
+    """
+    if isinstance(patients, (str, os.PathLike)):
+        from .patient import ScalePatient
+        patients = ScalePatient.iter_patients_from_csv(patients)
+    total = len(patients) if hasattr(patients, '__len__') else None
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_workers * 4
+    results = {}
+    pending = set()
+
+    def collect(futures):
+        for future in futures:
+            index, result, stats = future.result()
+            results[index] = result
+            if stats is not None:
+                cache.add_stats(stats)
+            if progress is not None:
+                progress(len(results), total)
+
+    initargs = (dpi, kinds, None, None) if cache is None else (dpi, kinds, cache.directory, cache.max_bytes)
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=initargs) as executor:
+        for index, patient in enumerate(patients):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(_render_job, index, patient, directory, format, kinds))
+        collect(wait(pending).done)
+
+    return [results[index] for index in range(len(results))]
@@ -0,0 +1,354 @@
+import bisect
+import json
+import keyword
+import math
+
+from .instrumentation import instrumented
+
+
+# Reference tables: for every metric, the patient attribute that is classified
+# ("value"), an optional attribute that selects the band ("band_by") and, per
+# gender ("*" for both), the list of bands with their category cutoffs.
+# A plain cutoff means "value < cutoff", {"le": x} means "value <= x". Band
+# bounds use "ge"/"gt" and "le"/"lt"; a missing lower bound continues the
+# previous band and a missing upper bound is open ended.
+REFERENCE_TABLES = {
+    "cardiovascular_risk": {
+        "value": "waist_circunference",
+        "labels": ["Normal", "Elevado", "Muy elevado"],
+        "groups": {
+            "m": [{"cutoffs": [82, {"le": 87}]}],
+            "h": [{"cutoffs": [95, {"le": 101}]}],
+        },
+    },
+    "complexion": {
+        "value": "weight",
+        "band_by": "height",
+        "labels": ["pequeña", "mediana", "grande"],
+        "fallback": "No se puede determinar la complexión",
+        "groups": {
+            "m": [
+                {"ge": 155, "lt": 159, "cutoffs": [54, 59]},
+                {"ge": 160, "lt": 164, "cutoffs": [56, 61]},
+                {"ge": 165, "lt": 169, "cutoffs": [59, 64]},
+                {"ge": 170, "le": 175, "cutoffs": [65, 69]},
+            ],
+            "h": [
+                {"ge": 170, "lt": 174, "cutoffs": [66, 70]},
+                {"ge": 175, "lt": 179, "cutoffs": [69, 73]},
+                {"ge": 180, "lt": 184, "cutoffs": [71, 76]},
+                {"ge": 185, "le": 190, "cutoffs": [76, 85]},
+            ],
+        },
+    },
+    "imc_standard": {
+        "value": "imc",
+        "labels": [
+            "Peso insuficiente",
+            "Normopeso",
+            "Sobrepeso grado I",
+            "Sobrepeso grado II (preobesidad)",
+            "Obesidad de tipo I",
+            "Obesidad de tipo II",
+            "Obesidad de tipo III (mórbida)",
+            "Obesidad de tipo IV (extrema)",
+        ],
+        "groups": {
+            "*": [{"cutoffs": [18.5, 25, 27, 30, 35, 40, 50]}],
+        },
+    },
+    "mgras_percent": {
+        "value": "mgras_percent",
+        "band_by": "age",
+        "labels": ["Delgado", "Ideal", "Promedio", "Superior al promedio"],
+        "groups": {
+            "m": [
+                {"le": 20, "cutoffs": [16, 22, 30]},
+                {"le": 25, "cutoffs": [18.5, 25, 31]},
+                {"le": 30, "cutoffs": [19, 25, 32]},
+                {"le": 35, "cutoffs": [19, 25, 33]},
+                {"le": 40, "cutoffs": [22, 28, 33]},
+                {"le": 45, "cutoffs": [23, 28, 35]},
+                {"le": 50, "cutoffs": [23, 29, 35]},
+                {"le": 55, "cutoffs": [24, 30, 36]},
+                {"cutoffs": [25, 31, 38]},
+            ],
+            "h": [
+                {"le": 20, "cutoffs": [4, 14, 19]},
+                {"le": 25, "cutoffs": [5, 14.5, 22]},
+                {"le": 30, "cutoffs": [8.5, 17, 23]},
+                {"le": 35, "cutoffs": [9.5, 18, 24]},
+                {"le": 40, "cutoffs": [10.5, 19, 25]},
+                {"le": 45, "cutoffs": [14, 22, 27]},
+                {"le": 50, "cutoffs": [15, 23, 28]},
+                {"le": 55, "cutoffs": [16, 24, 29]},
+                {"cutoffs": [17, 25, 31]},
+            ],
+        },
+    },
+    "w_level": {
+        "value": "water_levels",
+        "labels": ["inferiores al promedio", "saludables", "superiores al promedio"],
+        "groups": {
+            "m": [{"cutoffs": [44, {"le": 61}]}],
+            "h": [{"cutoffs": [49, {"le": 66}]}],
+        },
+    },
+    "im_muscular": {
+        "value": "muscular_mass_kg",
+        "band_by": "age",
+        "labels": ["Baja", "Normal", "Excesiva"],
+        "groups": {
+            "m": [
+                {"le": 30, "cutoffs": [35, {"le": 41}]},
+                {"le": 60, "cutoffs": [33, {"le": 38}]},
+                {"cutoffs": [28, {"le": 33}]},
+            ],
+            "h": [
+                {"le": 30, "cutoffs": [43, {"le": 56}]},
+                {"le": 60, "cutoffs": [40, {"le": 50}]},
+                {"cutoffs": [38, {"le": 57}]},
+            ],
+        },
+    },
+    "ev_gv": {
+        "value": "visceral_gras",
+        "labels": ["Bien", "Medio", "Exceso", "Alarmante"],
+        "groups": {
+            "*": [{"cutoffs": [5, 9, 13]}],
+        },
+    },
+}
+
+
+class ClassificationTableError(ValueError):
+    """
+    Invalid reference table.
+    """
+
+
+def _edge(bound, inclusive):
+    # Every limit is stored as a strict "<" edge so one bisect_right (or
+    # numpy.searchsorted(side="right")) resolves it. "<= x" is "< next float after x".
+    return math.nextafter(bound, math.inf) if inclusive else float(bound)
+
+
+def _cutoff_edge(cutoff):
+    if isinstance(cutoff, dict):
+        return _edge(cutoff["le"], True)
+    return _edge(cutoff, False)
+
+
+class CompiledGroup:
+    """
+    One gender group of a table: sorted band edges, the band owning every slot
+    between edges (-1 for gaps) and the sorted cutoff edges of every band.
+    """
+
+    def __init__(self, bands):
+        self.band_edges = []
+        self.slot_bands = [-1]
+        self.cutoff_edges = []
+        current = -math.inf
+
+        for index, band in enumerate(bands):
+            if "ge" in band or "gt" in band:
+                low = _edge(band["gt"], True) if "gt" in band else _edge(band["ge"], False)
+            else:
+                low = current
+            if "le" in band or "lt" in band:
+                high = _edge(band["le"], True) if "le" in band else _edge(band["lt"], False)
+            else:
+                high = math.inf
+            if low < current or high <= low:
+                raise ClassificationTableError(f"Band {band} overlaps or is not sorted.")
+
+            if low > current:
+                self.band_edges.append(low)
+                self.slot_bands.append(-1)
+            self.slot_bands[-1] = index
+            if high != math.inf:
+                self.band_edges.append(high)
+                self.slot_bands.append(-1)
+            current = high
+
+            edges = [_cutoff_edge(cutoff) for cutoff in band["cutoffs"]]
+            if edges != sorted(edges):
+                raise ClassificationTableError(f"Cutoffs {band['cutoffs']} must be sorted.")
+            self.cutoff_edges.append(edges)
+
+    def band(self, band_value):
+        return self.slot_bands[bisect.bisect_right(self.band_edges, band_value)]
+
+
+def _comparisons(edges, results, indent):
+    # bisect_right over sorted edges is the index of the first edge the value
+    # is below, so the lookup unrolls into one comparison per cutoff.
+    lines = [f"{indent}if value < {edge!r}: return {result!r}" for edge, result in zip(edges, results)]
+    return lines + [f"{indent}return {results[len(edges)]!r}"]
+
+
+class CompiledTable:
+
+    def __init__(self, metric, table):
+        self.metric = metric
+        # Canonical JSON of the table: equal definitions classify alike.
+        self.definition = json.dumps(table, sort_keys=True)
+        self.value = table["value"]
+        self.band_by = table.get("band_by")
+        for attribute in (self.value, self.band_by):
+            if attribute is not None and (not attribute.isidentifier() or keyword.iskeyword(attribute)):
+                raise ClassificationTableError(f"{metric}: '{attribute}' is not an attribute name.")
+        self.labels = tuple(table["labels"])
+        self.fallback = table.get("fallback")
+        if self.fallback is not None:
+            self.labels += (self.fallback,)
+        self.fallback_code = len(table["labels"])
+        self.groups = {gender: CompiledGroup(bands) for gender, bands in table["groups"].items()}
+        if not all(isinstance(gender, str) for gender in self.groups):
+            raise ClassificationTableError(f"{metric}: genders must be strings.")
+        for group in self.groups.values():
+            for edges in group.cutoff_edges:
+                if len(edges) != len(table["labels"]) - 1:
+                    raise ClassificationTableError(f"{metric}: {len(table['labels'])} labels need {len(table['labels']) - 1} cutoffs.")
+        self.classify = self._compile(range(len(self.labels)))
+        self.label = self._compile(self.labels)
+
+    def group(self, gender):
+        try:
+            return self.groups[gender] if gender in self.groups else self.groups["*"]
+        except KeyError:
+            raise ClassificationTableError(f"{self.metric} has no reference values for gender '{gender}'.") from None
+
+    def code(self, gender, band_value, value):
+        group = self.group(gender)
+        band = group.band(band_value) if self.band_by else 0
+        if band < 0:
+            return self._outside(band_value)
+        return bisect.bisect_right(group.cutoff_edges[band], value)
+
+    def _outside(self, band_value):
+        if self.fallback is None:
+            raise ValueError(f"{band_value} is outside the reference bands of {self.metric}")
+        return self.fallback_code
+
+    def _compile(self, results):
+        """
+        Function of a patient object that returns ``results[code]``, where code
+        is what code() returns: classify() with the codes, label() with the
+        labels. It is generated as Python source, one "if" per gender, band edge
+        and cutoff, so a scalar lookup makes no calls; "*" comes last and
+        catches every other gender.
+        """
+        genders = sorted(self.groups, key=lambda gender: gender == "*")
+        lines = ["def classify(patient):"]
+        if genders != ["*"]:
+            lines.append("    gender = patient.gender")
+        for gender in genders:
+            indent = "    "
+            if gender != "*":
+                lines.append(f"    if gender == {gender!r}:")
+                indent = "        "
+            lines += self._group_source(self.groups[gender], results, indent)
+        if "*" not in self.groups:
+            lines.append("    unknown_gender(gender)")
+        namespace = {"inf": math.inf, "unknown_gender": self.group, "outside": self._outside, "results": results}
+        exec("\n".join(lines), namespace)
+        return namespace["classify"]
+
+    def _group_source(self, group, results, indent):
+        lines = [f"{indent}value = patient.{self.value}"]
+        if not self.band_by:
+            return lines + _comparisons(group.cutoff_edges[0], results, indent)
+        lines.append(f"{indent}band_value = patient.{self.band_by}")
+        # slot_bands has one more entry than band_edges: the slot past the last edge.
+        for edge, band in zip(group.band_edges + [None], group.slot_bands):
+            body = indent
+            if edge is not None:
+                lines.append(f"{indent}if band_value < {edge!r}:")
+                body = indent + "    "
+            if band < 0:
+                lines.append(f"{body}return results[outside(band_value)]")
+            else:
+                lines += _comparisons(group.cutoff_edges[band], results, body)
+        return lines
+
+
+class CompiledTables(dict):
+    """
+    metric -> CompiledTable. A missing metric raises ClassificationTableError,
+    so lookups need no try block of their own.
+    """
+
+    def __missing__(self, metric):
+        raise ClassificationTableError(f"There is no reference table for '{metric}'.")
+
+
+class ClassificationEngine:
+    """
+    Classifies patient metrics by bisection over precompiled reference tables.
+    """
+
+    def __init__(self, tables=None):
+        tables = REFERENCE_TABLES if tables is None else tables
+        self.tables = CompiledTables((metric, CompiledTable(metric, table)) for metric, table in tables.items())
+
+    @classmethod
+    def from_json(cls, file_path):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file))
+
+    def table(self, metric):
+        return self.tables[metric]
+
+    def labels(self, metric):
+        return self.tables[metric].labels
+
+    @instrumented("classify_code")
+    def classify_code(self, metric, patient):
+        return self.tables[metric].classify(patient)
+
+    def classify(self, metric, patient):
+        return self.tables[metric].label(patient)
+
+
+# metric -> label function (CompiledTable.label) of the active engine. It is a
+# plain module-level dict, updated in place when the tables are replaced, so
+# the Patient.get_* methods resolve a label with one lookup and one call.
+LABEL_FUNCTIONS = {}
+
+
+def _no_table(metric):
+    def label(patient):
+        raise ClassificationTableError(f"There is no reference table for '{metric}'.")
+    return label
+
+
+def _activate(engine):
+    global _engine
+    _engine = engine
+    functions = {metric: _no_table(metric) for metric in REFERENCE_TABLES}
+    functions.update((metric, table.label) for metric, table in engine.tables.items())
+    LABEL_FUNCTIONS.update(functions)
+    for metric in LABEL_FUNCTIONS.keys() - functions.keys():
+        del LABEL_FUNCTIONS[metric]
+    return engine
+
+
+_activate(ClassificationEngine())
+
+
+def get_engine():
+    return _engine
+
+
+def load_reference_tables(source):
+    """
+    Replace the reference tables used by ScalePatient and PatientBatch. ``source``
+    is a JSON file path, a dict of tables or a ClassificationEngine.
+    """
+    if isinstance(source, ClassificationEngine):
+        return _activate(source)
+    if isinstance(source, dict):
+        return _activate(ClassificationEngine(source))
+    return _activate(ClassificationEngine.from_json(source))
@@ -0,0 +1,318 @@
+import numpy as np
+
+from .batch import PatientBatch
+
+
+ALLERGENS = ("gluten", "lactosa", "huevo", "frutos secos", "cacahuete", "pescado", "marisco", "soja")
+TAGS = ("carne", "cerdo", "pescado", "marisco", "lacteo", "huevo")
+# Tags every diet preference excludes.
+DIETS = {
+    "omnivoro": (),
+    "sin cerdo": ("cerdo",),
+    "pescetariano": ("carne", "cerdo"),
+    "vegetariano": ("carne", "cerdo", "pescado", "marisco"),
+    "vegano": ("carne", "cerdo", "pescado", "marisco", "lacteo", "huevo"),
+}
+ROLES = ("cereal", "lacteo", "fruta", "proteina", "hidrato", "verdura", "grasa")
+# Meal, share of the daily calories and the roles of the foods it is made of.
+MEALS = (
+    ("desayuno", 0.25, ("cereal", "lacteo", "fruta")),
+    ("comida", 0.35, ("proteina", "hidrato", "verdura", "grasa")),
+    ("merienda", 0.10, ("fruta", "grasa")),
+    ("cena", 0.30, ("proteina", "verdura", "hidrato", "grasa")),
+)
+# Share of the calories from protein, carbohydrates and fat; kcal per gram of each.
+MACRO_SPLIT = (0.20, 0.50, 0.30)
+KCAL_PER_GRAM = (4, 4, 9)
+PORTION_STEP = 5
+# Portion ranges below are for a REFERENCE_KCAL diet and scale with the target,
+# within PORTION_SCALE_LIMITS.
+REFERENCE_KCAL = 2000
+PORTION_SCALE_LIMITS = (0.6, 2.2)
+
+# Name, kcal, protein, carbohydrates and fat per 100 g, role, meals, allergens,
+# tags and the smallest and largest portion in grams.
+FOODS = (
+    ("Avena", 389, 16.9, 66.3, 6.9, "cereal", ("desayuno",), ("gluten",), (), 30, 90),
+    ("Pan integral", 247, 13.0, 41.0, 3.4, "cereal", ("desayuno",), ("gluten",), (), 40, 120),
+    ("Tortitas de arroz", 387, 8.0, 81.0, 2.8, "cereal", ("desayuno",), (), (), 20, 70),
+    ("Copos de maíz", 357, 7.5, 84.0, 0.4, "cereal", ("desayuno",), (), (), 30, 80),
+    ("Leche semidesnatada", 46, 3.3, 4.8, 1.6, "lacteo", ("desayuno",), ("lactosa",), ("lacteo",), 150, 350),
+    ("Yogur natural", 61, 3.5, 4.7, 3.3, "lacteo", ("desayuno",), ("lactosa",), ("lacteo",), 125, 300),
+    ("Queso fresco", 174, 12.0, 3.0, 13.0, "lacteo", ("desayuno",), ("lactosa",), ("lacteo",), 40, 120),
+    ("Bebida de soja", 33, 3.3, 0.6, 1.8, "lacteo", ("desayuno",), ("soja",), (), 150, 350),
+    ("Huevos revueltos", 148, 10.0, 1.6, 11.0, "lacteo", ("desayuno",), ("huevo",), ("huevo",), 60, 150),
+    ("Plátano", 89, 1.1, 22.8, 0.3, "fruta", ("desayuno", "merienda"), (), (), 100, 250),
+    ("Manzana", 52, 0.3, 13.8, 0.2, "fruta", ("desayuno", "merienda"), (), (), 120, 300),
+    ("Naranja", 47, 0.9, 11.8, 0.1, "fruta", ("desayuno", "merienda"), (), (), 120, 300),
+    ("Fresas", 32, 0.7, 7.7, 0.3, "fruta", ("desayuno", "merienda"), (), (), 100, 300),
+    ("Pechuga de pollo", 165, 31.0, 0.0, 3.6, "proteina", ("comida", "cena"), (), ("carne",), 100, 250),
+    ("Ternera magra", 158, 26.0, 0.0, 6.0, "proteina", ("comida", "cena"), (), ("carne",), 100, 220),
+    ("Lomo de cerdo", 143, 26.0, 0.0, 3.5, "proteina", ("comida", "cena"), (), ("carne", "cerdo"), 100, 220),
+    ("Merluza", 90, 18.0, 0.0, 1.3, "proteina", ("comida", "cena"), ("pescado",), ("pescado",), 120, 280),
+    ("Salmón", 208, 20.0, 0.0, 13.0, "proteina", ("comida", "cena"), ("pescado",), ("pescado",), 100, 200),
+    ("Atún al natural", 116, 26.0, 0.0, 1.0, "proteina", ("comida", "cena"), ("pescado",), ("pescado",), 80, 200),
+    ("Gambas", 99, 24.0, 0.2, 0.3, "proteina", ("comida", "cena"), ("marisco",), ("marisco",), 100, 250),
+    ("Tortilla francesa", 154, 11.0, 0.6, 12.0, "proteina", ("cena",), ("huevo",), ("huevo",), 100, 200),
+    ("Tofu", 144, 15.8, 2.8, 8.7, "proteina", ("comida", "cena"), ("soja",), (), 100, 250),
+    ("Lentejas cocidas", 116, 9.0, 20.0, 0.4, "proteina", ("comida", "cena"), (), (), 150, 350),
+    ("Garbanzos cocidos", 164, 8.9, 27.4, 2.6, "proteina", ("comida", "cena"), (), (), 120, 300),
+    ("Arroz cocido", 130, 2.7, 28.0, 0.3, "hidrato", ("comida", "cena"), (), (), 80, 300),
+    ("Pasta cocida", 158, 5.8, 31.0, 0.9, "hidrato", ("comida", "cena"), ("gluten",), (), 80, 300),
+    ("Patata cocida", 87, 1.9, 20.0, 0.1, "hidrato", ("comida", "cena"), (), (), 100, 350),
+    ("Quinoa cocida", 120, 4.4, 21.3, 1.9, "hidrato", ("comida", "cena"), (), (), 80, 250),
+    ("Pan integral", 247, 13.0, 41.0, 3.4, "hidrato", ("comida", "cena"), ("gluten",), (), 30, 100),
+    ("Brócoli", 34, 2.8, 7.0, 0.4, "verdura", ("comida", "cena"), (), (), 100, 300),
+    ("Ensalada verde", 15, 1.4, 2.9, 0.2, "verdura", ("comida", "cena"), (), (), 80, 250),
+    ("Judías verdes", 31, 1.8, 7.0, 0.2, "verdura", ("comida", "cena"), (), (), 100, 300),
+    ("Calabacín", 17, 1.2, 3.1, 0.3, "verdura", ("comida", "cena"), (), (), 100, 300),
+    ("Tomate", 18, 0.9, 3.9, 0.2, "verdura", ("comida", "cena"), (), (), 100, 300),
+    ("Aceite de oliva", 884, 0.0, 0.0, 100.0, "grasa", ("comida", "cena"), (), (), 5, 40),
+    ("Aguacate", 160, 2.0, 8.5, 14.7, "grasa", ("comida", "cena", "merienda"), (), (), 30, 150),
+    ("Nueces", 654, 15.2, 13.7, 65.2, "grasa", ("merienda",), ("frutos secos",), (), 10, 50),
+    ("Almendras", 579, 21.0, 21.6, 49.9, "grasa", ("merienda",), ("frutos secos",), (), 10, 50),
+    ("Cacahuetes", 567, 25.8, 16.1, 49.2, "grasa", ("merienda",), ("cacahuete",), (), 10, 50),
+)
+
+
+def _bits(names, choices):
+    mask = 0
+    for name in names:
+        mask |= 1 << choices.index(name)
+    return mask
+
+
+class FoodTable:
+    """
+    Food composition table as numpy columns. Allergens and tags are uint32
+    bitsets, so excluding foods for a patient is one mask operation.
+    """
+
+    def __init__(self, foods=FOODS):
+        meal_names = [meal for meal, _, _ in MEALS]
+        self.names = [food[0] for food in foods]
+        # kcal, protein, carbohydrates and fat per gram.
+        self.nutrients = np.array([food[1:5] for food in foods], dtype=np.float64) / 100
+        self.roles = np.array([ROLES.index(food[5]) for food in foods], dtype=np.uint8)
+        self.meals = np.array([_bits(food[6], meal_names) for food in foods], dtype=np.uint32)
+        self.allergens = np.array([_bits(food[7], ALLERGENS) for food in foods], dtype=np.uint32)
+        self.tags = np.array([_bits(food[8], TAGS) for food in foods], dtype=np.uint32)
+        self.min_grams = np.array([food[9] for food in foods], dtype=np.float64)
+        self.max_grams = np.array([food[10] for food in foods], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def allowed(self, profile):
+        return ((self.allergens & np.uint32(profile.allergen_bits)) == 0) & ((self.tags & np.uint32(profile.tag_bits)) == 0)
+
+    def candidates(self, role, meal):
+        meal_bit = np.uint32(1 << [name for name, _, _ in MEALS].index(meal))
+        return (self.roles == ROLES.index(role)) & ((self.meals & meal_bit) != 0)
+
+
+class DietProfile:
+    """
+    Allergies and diet preference of one patient.
+    """
+
+    __slots__ = ("allergens", "diet", "allergen_bits", "tag_bits")
+
+    def __init__(self, allergens=(), diet="omnivoro"):
+        allergens = tuple(allergen.lower() for allergen in allergens)
+        for allergen in allergens:
+            if allergen not in ALLERGENS:
+                raise ValueError(f"{allergen} invalid, must be in {list(ALLERGENS)}")
+        if diet not in DIETS:
+            raise ValueError(f"{diet} invalid, must be in {list(DIETS)}")
+        self.allergens = allergens
+        self.diet = diet
+        self.allergen_bits = _bits(allergens, ALLERGENS)
+        self.tag_bits = _bits(DIETS[diet], TAGS)
+
+
+class DayPlan:
+
+    __slots__ = ("meals", "totals")
+
+    def __init__(self, meals, totals):
+        self.meals = meals
+        self.totals = totals
+
+
+class WeeklyPlan:
+
+    __slots__ = ("patient_id", "name", "surname", "targets", "days", "within_tolerance")
+
+    def __init__(self, patient_id, name, surname, targets, days, within_tolerance):
+        self.patient_id = patient_id
+        self.name = name
+        self.surname = surname
+        self.targets = targets
+        self.days = days
+        self.within_tolerance = within_tolerance
+
+    def render(self):
+        lines = [f"Plan semanal de {self.name} {self.surname}: {round(self.targets['kcal'])} kcal al día"]
+        for number, day in enumerate(self.days, 1):
+            lines.append("----------------------------------------")
+            lines.append(f"Día {number} ({round(day.totals['kcal'])} kcal, {round(day.totals['protein'])} g proteína, "
+                         f"{round(day.totals['carbs'])} g hidratos, {round(day.totals['fat'])} g grasa)")
+            for meal, foods in day.meals.items():
+                lines.append(f"  {meal}: " + ", ".join(f"{food} {grams} g" for food, grams in foods))
+        return "\n".join(lines)
+
+
+class DietPlanner:
+    """
+    Builds daily menus that hit the calorie target of basal_metabolic_rate() and
+    the MACRO_SPLIT macros. Every day draws one allowed food per meal role and
+    solves all portions of the day at once, for every patient together:
+    a bounded, regularized least squares over the meal calories and the daily
+    macros, solved with batched numpy.linalg.solve. Days out of tolerance are
+    drawn again up to ``attempts`` times, keeping the best one.
+    """
+
+    def __init__(self, table=None, tolerance=0.05, macro_tolerance=0.10, attempts=8, seed=0):
+        self.table = FoodTable() if table is None else table
+        self.tolerance = tolerance
+        self.macro_tolerance = macro_tolerance
+        self.attempts = attempts
+        self.rng = np.random.default_rng(seed)
+
+        # One variable per food slot of the day: its meal and its candidate foods.
+        self.slot_meals = []
+        self.slot_candidates = []
+        for meal_index, (meal, _, roles) in enumerate(MEALS):
+            for role in roles:
+                self.slot_meals.append(meal_index)
+                self.slot_candidates.append(self.table.candidates(role, meal))
+        self.slot_meals = np.array(self.slot_meals)
+        self.slot_candidates = np.array(self.slot_candidates)
+
+    def targets(self, calories):
+        """
+        Daily (P, 7) targets: the calories of every meal, then protein,
+        carbohydrate and fat grams.
+        """
+        calories = np.asarray(calories, dtype=np.float64)
+        shares = np.array([share for _, share, _ in MEALS])
+        macros = np.array(MACRO_SPLIT) / np.array(KCAL_PER_GRAM)
+        return np.concatenate((calories[:, None] * shares, calories[:, None] * macros), axis=1)
+
+    def _draw(self, allowed):
+        """
+        (P, slots) food indexes, one random allowed candidate per slot; len(table)
+        when a patient has no candidate for a slot.
+        """
+        foods = len(self.table)
+        scores = self.rng.random((len(allowed), len(self.slot_meals), foods))
+        scores *= allowed[:, None, :] & self.slot_candidates[None, :, :]
+        choice = scores.argmax(axis=2)
+        return np.where(scores.max(axis=2) > 0, choice, foods)
+
+    def _solve(self, choices, targets):
+        table = self.table
+        nutrients = np.vstack((table.nutrients, np.zeros(4)))
+        portion_scale = np.clip(targets[:, :len(MEALS)].sum(axis=1) / REFERENCE_KCAL, *PORTION_SCALE_LIMITS)[:, None]
+        low = np.append(table.min_grams, 0)[choices] * portion_scale
+        high = np.append(table.max_grams, 0)[choices] * portion_scale
+        # Snap the limits onto the PORTION_STEP grid so rounded portions stay
+        # multiples of the step after clipping.
+        low = np.ceil(low / PORTION_STEP) * PORTION_STEP
+        high = np.maximum(np.floor(high / PORTION_STEP) * PORTION_STEP, low)
+        per_gram = nutrients[choices]                                   # (P, S, 4)
+
+        patients, slots = choices.shape
+        meals = len(MEALS)
+        matrix = np.zeros((patients, meals + 3, slots))
+        matrix[:, self.slot_meals, np.arange(slots)] = per_gram[:, :, 0]
+        matrix[:, meals:, :] = per_gram[:, :, 1:].transpose(0, 2, 1)
+        matrix /= targets[:, :, None]                                   # relative errors
+
+        # Portions are solved as offsets from the middle of their range, scaled
+        # by the range, with a small ridge that keeps them near the middle.
+        spread = high - low
+        grams = (low + high) / 2
+        scaled = matrix * spread[:, None, :]
+        normal = scaled.transpose(0, 2, 1) @ scaled
+        free = spread > 0
+        for _ in range(4):
+            ridge = np.where(free, 1e-3, 1e6)
+            residual = 1 - np.einsum('prs,ps->pr', matrix, grams)
+            rhs = np.einsum('prs,pr->ps', scaled, residual)
+            step = np.linalg.solve(normal + ridge[:, :, None] * np.eye(slots), rhs[:, :, None])[:, :, 0]
+            grams = np.clip(grams + spread * step, low, high)
+            free = free & (grams > low) & (grams < high)
+
+        grams = np.clip(np.round(grams / PORTION_STEP) * PORTION_STEP, low, high)
+        totals = np.einsum('psn,ps->pn', per_gram, grams)               # kcal, protein, carbs, fat
+        return grams, totals
+
+    def _errors(self, totals, targets):
+        calories = targets[:, :len(MEALS)].sum(axis=1)
+        kcal_error = np.abs(totals[:, 0] - calories) / calories
+        macro_error = (np.abs(totals[:, 1:] - targets[:, len(MEALS):]) / targets[:, len(MEALS):]).max(axis=1)
+        return np.maximum(kcal_error / self.tolerance, macro_error / self.macro_tolerance)
+
+    def plan_days(self, calories, allowed, days=7):
+        """
+        (choices, grams, totals, errors) arrays of shape (days, P, ...) for every
+        patient; an error <= 1 means the day is within tolerance.
+        """
+        targets = self.targets(calories)
+        plans = []
+        for _ in range(days):
+            choices = self._draw(allowed)
+            grams, totals = self._solve(choices, targets)
+            errors = self._errors(totals, targets)
+            for _ in range(self.attempts - 1):
+                retry = np.flatnonzero(errors > 1)
+                if not len(retry):
+                    break
+                new_choices = self._draw(allowed[retry])
+                new_grams, new_totals = self._solve(new_choices, targets[retry])
+                new_errors = self._errors(new_totals, targets[retry])
+                better = new_errors < errors[retry]
+                rows = retry[better]
+                choices[rows], grams[rows] = new_choices[better], new_grams[better]
+                totals[rows], errors[rows] = new_totals[better], new_errors[better]
+            plans.append((choices, grams, totals, errors))
+        return tuple(np.stack(arrays) for arrays in zip(*plans))
+
+    def plan_week(self, patients, profiles=None, days=7):
+        """
+        One WeeklyPlan per patient. ``profiles`` is a list aligned with
+        ``patients`` or a dict keyed by patient_id; patients without a profile
+        get DietProfile().
+        """
+        patients = list(patients)
+        if not patients:
+            return []
+        default = DietProfile()
+        if isinstance(profiles, dict):
+            profiles = [profiles.get(p.patient_id, default) for p in patients]
+        elif profiles is None:
+            profiles = [default] * len(patients)
+
+        calories = PatientBatch.from_patients(patients).get_basal_metabolic_rate()
+        allowed = np.array([self.table.allowed(profile) for profile in profiles])
+        choices, grams, totals, errors = self.plan_days(calories, allowed, days)
+        targets = self.targets(calories)
+
+        names = self.table.names + [None]
+        plans = []
+        for i, patient in enumerate(patients):
+            week = []
+            for day in range(days):
+                meals = {}
+                for slot, meal_index in enumerate(self.slot_meals):
+                    food = names[choices[day, i, slot]]
+                    if food is not None and grams[day, i, slot] > 0:
+                        meals.setdefault(MEALS[meal_index][0], []).append((food, int(grams[day, i, slot])))
+                week.append(DayPlan(meals, dict(zip(("kcal", "protein", "carbs", "fat"), totals[day, i].tolist()))))
+            target = dict(zip(("kcal", "protein", "carbs", "fat"),
+                              [float(calories[i])] + targets[i, len(MEALS):].tolist()))
+            plans.append(WeeklyPlan(patient.patient_id, patient.name, patient.surname, target, week,
+                                    bool((errors[:, i] <= 1).all())))
+        return plans
@@ -0,0 +1,17 @@
+# Field and metric names shared by the patient classes, the batch, storage,
+# report and analytics modules. This module imports nothing, so the modules
+# that must stay light (patient.py, report.py) can use it too.
+
+# Constructor arguments of Patient, then the extra ones of ScalePatient.
+PATIENT_FIELDS = ("name", "surname", "age", "gender", "height", "weight", "activity", "waist_circunference")
+SCALE_FIELDS = ("mgras_percent", "bone_mass", "muscular_mass_kg", "imc", "metabolic_age", "visceral_gras", "water_levels")
+
+# Metrics classified for every patient, then the ones that need scale readings.
+PATIENT_METRICS = ("cardiovascular_risk", "complexion")
+SCALE_METRICS = ("imc_standard", "mgras_percent", "w_level", "im_muscular", "ev_gv")
+
+# Gender and activity codes are indexes into these tuples. ACTIVITY_ALIASES
+# maps the other accepted spellings to their index.
+GENDERS = ("h", "m")
+ACTIVITY_LEVELS = ("sedentario", "poco activo", "activo con moderacion", "activo", "muy activo")
+ACTIVITY_ALIASES = {"activo con moderación": 2}
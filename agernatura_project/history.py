@@ -0,0 +1,203 @@
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+
+TREND_METRICS = ("weight", "imc", "mgras_percent", "muscular_mass_kg", "visceral_gras")
+MOVING_AVERAGE_WINDOW = 5
+SECONDS_PER_DAY = 86400
+
+
+class RunningTrend:
+    """
+    Aggregates of one metric updated in O(1) per reading: latest value, delta
+    against the previous reading, moving average over the last ``window``
+    readings and least-squares slope per day over the whole history.
+    """
+
+    __slots__ = ("count", "latest", "previous", "window", "window_sum", "origin",
+                 "sum_t", "sum_y", "sum_tt", "sum_ty")
+
+    def __init__(self, window=MOVING_AVERAGE_WINDOW):
+        self.count = 0
+        self.latest = None
+        self.previous = None
+        self.window = deque(maxlen=window)
+        self.window_sum = 0.0
+        self.origin = None
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+
+    def add(self, timestamp, value):
+        if self.origin is None:
+            self.origin = timestamp
+        # Times are kept relative to the first reading so the sums stay small.
+        t = (timestamp - self.origin) / SECONDS_PER_DAY
+        self.count += 1
+        self.previous, self.latest = self.latest, value
+        if len(self.window) == self.window.maxlen:
+            self.window_sum -= self.window[0]
+        self.window.append(value)
+        self.window_sum += value
+        self.sum_t += t
+        self.sum_y += value
+        self.sum_tt += t * t
+        self.sum_ty += t * value
+
+    @property
+    def delta(self):
+        return None if self.previous is None else self.latest - self.previous
+
+    @property
+    def moving_average(self):
+        return self.window_sum / len(self.window) if self.window else None
+
+    @property
+    def slope(self):
+        denominator = self.count * self.sum_tt - self.sum_t ** 2
+        if self.count < 2 or denominator <= 0:
+            return None
+        return (self.count * self.sum_ty - self.sum_t * self.sum_y) / denominator
+
+    def summary(self):
+        return {
+            "latest": self.latest,
+            "delta": self.delta,
+            "moving_average": self.moving_average,
+            "slope_per_day": self.slope,
+            "readings": self.count,
+        }
+
+
+class PatientTrend:
+
+    __slots__ = ("first_timestamp", "last_timestamp", "metrics")
+
+    def __init__(self, window):
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.metrics = {metric: RunningTrend(window) for metric in TREND_METRICS}
+
+    def add(self, timestamp, values):
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        for metric, trend in self.metrics.items():
+            trend.add(timestamp, values[metric])
+
+
+def _timestamp(value):
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class MeasurementLog:
+    """
+    Append-only JSON Lines log of scale readings per patient. Opening the log
+    replays it once; after that every record() appends a line and updates the
+    running aggregates, so trend() is O(1) per patient. A partial last line
+    left by a crash is dropped on open (``truncated_bytes``).
+    """
+
+    def __init__(self, file_path, window=MOVING_AVERAGE_WINDOW, sync=False):
+        self.file_path = file_path
+        self.window = window
+        self.sync = sync
+        self.trends = {}
+        self.truncated_bytes = 0
+        if os.path.exists(file_path):
+            self._replay()
+        self.file = open(file_path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        # A crash in the middle of record() can leave a partial last line. It is
+        # cut off so the next append starts on a line of its own; a bad line
+        # anywhere else means the log is corrupt.
+        torn = None
+        offset = 0
+        with open(self.file_path, 'rb') as file:
+            for number, line in enumerate(file, 1):
+                if line.strip():
+                    if torn is not None:
+                        raise ValueError(f"{self.file_path}: line {torn[0]} is corrupt.")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        torn = (number, offset)
+                    else:
+                        self._apply(entry["patient_id"], entry["timestamp"], entry)
+                offset += len(line)
+            ends_with_newline = offset == 0 or line.endswith(b"\n")
+
+        if torn is not None:
+            with open(self.file_path, 'r+b') as file:
+                file.truncate(torn[1])
+            self.truncated_bytes = offset - torn[1]
+        elif not ends_with_newline:
+            with open(self.file_path, 'ab') as file:
+                file.write(b"\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _apply(self, patient_id, timestamp, values):
+        if patient_id not in self.trends:
+            self.trends[patient_id] = PatientTrend(self.window)
+        self.trends[patient_id].add(timestamp, values)
+
+    def record(self, scale_patient, timestamp=None, patient_id=None):
+        """
+        Append one reading of ``scale_patient``. ``patient_id`` defaults to the
+        patient's own patient_id; ``timestamp`` is a datetime or epoch seconds
+        and defaults to now.
+        """
+        patient_id = patient_id if patient_id is not None else scale_patient.patient_id
+        if patient_id is None:
+            raise ValueError("A patient_id is needed to link readings over time.")
+        timestamp = _timestamp(timestamp)
+        trend = self.trends.get(patient_id)
+        if trend is not None and timestamp < trend.last_timestamp:
+            raise ValueError(f"Reading at {timestamp} is older than the last one for {patient_id}.")
+
+        entry = {"patient_id": patient_id, "timestamp": timestamp}
+        entry.update({metric: getattr(scale_patient, metric) for metric in TREND_METRICS})
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self._apply(patient_id, timestamp, entry)
+
+    def patients(self):
+        return list(self.trends)
+
+    def trend(self, patient_id):
+        """
+        {metric: {"latest", "delta", "moving_average", "slope_per_day", "readings"}}
+        for one patient, or None when the patient has no readings.
+        """
+        trend = self.trends.get(patient_id)
+        if trend is None:
+            return None
+        return {metric: running.summary() for metric, running in trend.metrics.items()}
+
+    def readings(self, patient_id):
+        """
+        Full reading history of one patient, read back from the log file.
+        """
+        self.file.flush()
+        with open(self.file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry["patient_id"] == patient_id:
+                        yield entry
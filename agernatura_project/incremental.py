@@ -0,0 +1,179 @@
+import csv
+import hashlib
+import json
+import os
+
+from .patient import CSV_ROW_ERRORS, Patient, RejectedRow
+from .report import build_reports
+
+
+MANIFEST_VERSION = 1
+KEY_COLUMNS = ("Name", "Surname")
+KEY_SEPARATOR = "\x1f"
+
+
+def row_hash(row):
+    return hashlib.blake2b(KEY_SEPARATOR.join(row).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ChangeSet:
+    """
+    What an incremental run found: new and changed patients (with their reports),
+    the patient_ids of deleted rows, the count of unchanged rows and the
+    rejected rows.
+    """
+
+    def __init__(self):
+        self.inserted = []
+        self.updated = []
+        self.deleted = []
+        self.unchanged = 0
+        self.rejected = []
+        self.reports = {}
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def __repr__(self):
+        return (f"ChangeSet(inserted={len(self.inserted)}, updated={len(self.updated)}, deleted={len(self.deleted)}, "
+                f"unchanged={self.unchanged}, rejected={len(self.rejected)})")
+
+
+class IncrementalIngest:
+    """
+    Re-ingests a fully re-exported patient CSV processing only the rows that
+    changed since the last run.
+
+    A JSON manifest maps every row identity (the ``key_columns`` values plus the
+    occurrence number, for repeated keys) to its patient_id and a hash of the
+    row. Rows with a repeated key are matched to the previous run by hash first
+    and by occurrence order only for the rest, so removing one namesake does not
+    move another's patient_id. Rows whose hash is unchanged are skipped without
+    being parsed; new and changed rows are validated and classified, and blank
+    lines are ignored. Updated rows keep their
+    patient_id and new ones get the next unused id. The manifest is replaced
+    atomically at the end of a run.
+    """
+
+    def __init__(self, manifest_path, cls=Patient, key_columns=KEY_COLUMNS):
+        self.manifest_path = manifest_path
+        self.cls = cls
+        self.key_columns = tuple(key_columns)
+        self.rows = {}
+        self.next_id = 1
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+            if manifest.get("version") != MANIFEST_VERSION or tuple(manifest["key_columns"]) != self.key_columns:
+                raise ValueError(f"{manifest_path} was written with another manifest version or key columns.")
+            self.rows = {key: tuple(entry) for key, entry in manifest["rows"].items()}
+            self.next_id = manifest["next_id"]
+
+    def save(self):
+        temporary = f"{self.manifest_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "key_columns": list(self.key_columns),
+                "next_id": self.next_id,
+                "rows": self.rows,
+            }, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.manifest_path)
+
+    def run(self, file_path, errors=None, commit=True):
+        """
+        ChangeSet of ``file_path`` against the manifest, which is updated and
+        saved unless ``commit`` is False. Rejected rows are also appended to
+        ``errors`` when a sink is given; a changed row that is rejected keeps
+        its previous manifest entry so it is tried again on the next run.
+        """
+        changes = ChangeSet()
+        next_id = self.next_id
+        # Previous entries by (identity, row hash), in occurrence order.
+        by_content = {}
+        for key, (_, digest) in self.rows.items():
+            identity, _, occurrence = key.rpartition(KEY_SEPARATOR)
+            by_content.setdefault((identity, digest), []).append((int(occurrence), key))
+        for keys in by_content.values():
+            keys.sort()
+
+        # One [identity, manifest entry] slot per row in file order, and the rows
+        # whose content matches no previous entry.
+        slots = []
+        pending = []
+        with open(file_path, 'r', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader)
+            key_indexes = [header.index(column) for column in self.key_columns]
+            for row in reader:
+                if not row:
+                    continue
+                identity = KEY_SEPARATOR.join(row[i] if i < len(row) else "" for i in key_indexes)
+                digest = row_hash(row)
+                matches = by_content.get((identity, digest))
+                if matches:
+                    slots.append([identity, self.rows[matches.pop(0)[1]]])
+                    changes.unchanged += 1
+                    continue
+                slot = [identity, None]
+                slots.append(slot)
+                pending.append((slot, digest, reader.line_num, dict(zip(header, row))))
+
+        # What content did not match pairs up with the remaining entries of the
+        # same identity in occurrence order, as updates.
+        left = {}
+        for (identity, _), keys in by_content.items():
+            left.setdefault(identity, []).extend(keys)
+        for keys in left.values():
+            keys.sort()
+
+        parsed = []
+        for slot, digest, line_number, row in pending:
+            keys = left.get(slot[0])
+            if keys:
+                slot[1] = self.rows[keys.pop(0)[1]]
+            try:
+                parsed.append((slot, digest, line_number, row, self.cls._from_csv_row(row)))
+            except CSV_ROW_ERRORS as e:
+                self._reject(changes, errors, RejectedRow(line_number, row, e))
+
+        reports = build_reports([patient for *_, patient in parsed])
+        for (slot, digest, line_number, row, patient), report in zip(parsed, reports):
+            if isinstance(report, Exception):
+                self._reject(changes, errors, RejectedRow(line_number, row, report))
+                continue
+            if slot[1] is None:
+                patient.patient_id = f"{next_id:03d}"
+                next_id += 1
+                changes.inserted.append(patient)
+            else:
+                patient.patient_id = slot[1][0]
+                changes.updated.append(patient)
+            report.patient_id = patient.patient_id
+            changes.reports[patient.patient_id] = report
+            slot[1] = (patient.patient_id, digest)
+
+        for keys in left.values():
+            changes.deleted.extend(self.rows[key][0] for _, key in keys)
+
+        rows = {}
+        occurrences = {}
+        for identity, entry in slots:
+            if entry is None:
+                continue
+            occurrence = occurrences.get(identity, 0)
+            occurrences[identity] = occurrence + 1
+            rows[f"{identity}{KEY_SEPARATOR}{occurrence}"] = entry
+
+        if commit:
+            self.rows = rows
+            self.next_id = next_id
+            self.save()
+        return changes
+
+    def _reject(self, changes, errors, rejected):
+        changes.rejected.append(rejected)
+        if errors is not None:
+            errors.append(rejected)
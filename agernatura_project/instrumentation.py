@@ -0,0 +1,208 @@
+import functools
+import os
+import sys
+import threading
+import time
+
+
+# The active Profiler, or None.
+_profiler = None
+# (function, stage) of every instrumented method. Their timing wrappers are
+# set on the classes by Profiler.start() and removed by stop(), so with
+# profiling off the methods run unwrapped.
+_methods = []
+# tracemalloc is imported on demand: it pulls in enough of the stdlib to show
+# up in the import time of agernatura_project.patient.
+tracemalloc = None
+
+
+class StageStats:
+
+    __slots__ = ("calls", "wall_ns", "cpu_ns", "max_wall_ns", "alloc_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_ns = 0
+        self.cpu_ns = 0
+        self.max_wall_ns = 0
+        self.alloc_bytes = 0
+
+
+class Profiler:
+    """
+    Per-stage call counters, wall and CPU timers and, optionally, net traced
+    allocations and a Chrome trace (chrome://tracing, Perfetto) of every call.
+    Stage times are inclusive: a stage called from another one counts in both.
+    """
+
+    def __init__(self, track_allocations=False, trace=False, max_events=1_000_000):
+        self.track_allocations = track_allocations
+        self.trace = trace
+        self.max_events = max_events
+        self.stages = {}
+        self.events = []
+        self.dropped_events = 0
+        self._origin_ns = time.perf_counter_ns()
+        self._started_tracemalloc = False
+
+    def start(self):
+        global _profiler, tracemalloc
+        if _profiler is not None and _profiler is not self:
+            raise RuntimeError("Another Profiler is already active.")
+        if self.track_allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+        if _profiler is None:
+            _install(True)
+        _profiler = self
+        return self
+
+    def stop(self):
+        global _profiler
+        if _profiler is self:
+            _install(False)
+            _profiler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def call(self, stage, func, args, kwargs):
+        allocated = tracemalloc.get_traced_memory()[0] if self.track_allocations else 0
+        cpu = time.thread_time_ns()
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall = time.perf_counter_ns() - start
+            cpu = time.thread_time_ns() - cpu
+            if self.track_allocations:
+                allocated = tracemalloc.get_traced_memory()[0] - allocated
+            self.record(stage, start, wall, cpu, allocated)
+
+    def record(self, stage, start_ns, wall_ns, cpu_ns, alloc_bytes=0):
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.calls += 1
+        stats.wall_ns += wall_ns
+        stats.cpu_ns += cpu_ns
+        stats.alloc_bytes += alloc_bytes
+        if wall_ns > stats.max_wall_ns:
+            stats.max_wall_ns = wall_ns
+        if self.trace:
+            if len(self.events) < self.max_events:
+                self.events.append((stage, start_ns, wall_ns, threading.get_ident()))
+            else:
+                self.dropped_events += 1
+
+    def summary(self):
+        """
+        One dict per stage, slowest total wall time first.
+        """
+        rows = []
+        for stage, stats in self.stages.items():
+            rows.append({
+                "stage": stage,
+                "calls": stats.calls,
+                "wall_s": stats.wall_ns / 1e9,
+                "cpu_s": stats.cpu_ns / 1e9,
+                "mean_us": stats.wall_ns / stats.calls / 1e3,
+                "max_us": stats.max_wall_ns / 1e3,
+                "alloc_bytes": stats.alloc_bytes if self.track_allocations else None,
+            })
+        return sorted(rows, key=lambda row: row["wall_s"], reverse=True)
+
+    def format_table(self):
+        lines = [f"{'stage':<36}{'calls':>10}{'wall s':>10}{'cpu s':>10}{'mean us':>10}{'max us':>10}"
+                 + (f"{'alloc KiB':>12}" if self.track_allocations else "")]
+        for row in self.summary():
+            line = (f"{row['stage']:<36}{row['calls']:>10}{row['wall_s']:>10.3f}{row['cpu_s']:>10.3f}"
+                    f"{row['mean_us']:>10.1f}{row['max_us']:>10.1f}")
+            if self.track_allocations:
+                line += f"{row['alloc_bytes'] / 1024:>12.1f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {"name": stage, "ph": "X", "ts": (start - self._origin_ns) / 1e3, "dur": wall / 1e3,
+                 "pid": pid, "tid": tid}
+                for stage, start, wall, tid in self.events
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": self.dropped_events},
+        }
+
+    def write_trace(self, file_path):
+        import json
+
+        with open(file_path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+
+def profile(track_allocations=False, trace=False):
+    """
+    ``with profile() as profiler: ...`` enables instrumentation for the block.
+    """
+    return Profiler(track_allocations, trace)
+
+
+def active_profiler():
+    return _profiler
+
+
+def _wrap(func, stage):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _profiler
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(stage, func, args, kwargs)
+    return wrapper
+
+
+def _install(enable):
+    """
+    Set the timing wrapper of every instrumented method on its class, or put
+    the plain function back. Methods of modules that are not imported yet are
+    skipped; they are wrapped when defined if a Profiler is active by then.
+    """
+    for func, stage in _methods:
+        owner = sys.modules.get(func.__module__)
+        *path, name = func.__qualname__.split(".")
+        try:
+            for part in path:
+                owner = getattr(owner, part)
+            current = vars(owner)[name]
+        except (AttributeError, KeyError, TypeError):
+            continue
+        method = _wrap(func, stage) if enable else func
+        if isinstance(current, (classmethod, staticmethod)):
+            method = type(current)(method)
+        setattr(owner, name, method)
+
+
+def instrumented(stage):
+    """
+    Decorator that records every call of the function as ``stage`` while a
+    Profiler is active. A method is left unwrapped while profiling is off, so
+    it costs nothing then. A module-level function can be imported by name
+    before profiling starts, so it always has a wrapper that checks for an
+    active Profiler.
+    """
+    def decorator(func):
+        if "." not in func.__qualname__:
+            return _wrap(func, stage)
+        _methods.append((func, stage))
+        return _wrap(func, stage) if _profiler is not None else func
+    return decorator
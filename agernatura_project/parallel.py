@@ -0,0 +1,161 @@
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .batch import PatientBatch, StringColumn
+from .fields import ACTIVITY_LEVELS, GENDERS, PATIENT_FIELDS, SCALE_FIELDS
+from .patient import Patient, RejectedRow, ScalePatient
+from .validation import CSV_COLUMNS, csv_columns, validate_columns
+
+
+def split_csv(file_path, parts):
+    """
+    Split the data rows of a CSV file into at most ``parts`` byte ranges. Every
+    range starts at the beginning of a row, so rows must not contain quoted
+    line breaks.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as file:
+        header = file.readline()
+        bounds = [file.tell()]
+        data_size = size - bounds[0]
+        for i in range(1, parts):
+            target = bounds[0] + data_size * i // parts
+            if target <= bounds[-1]:
+                continue
+            file.seek(target - 1)
+            file.readline()
+            position = file.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(size)
+    ranges = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+    return header.decode('utf-8'), ranges
+
+
+def _process_range(file_path, header, start, end, cls, score):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+
+    fieldnames = next(csv.reader([header]))
+    # split_csv rules out quoted line breaks, so row i is on line i + 1. Blank
+    # lines are skipped, as DictReader does in iter_patients_from_csv.
+    numbered = [(line, row) for line, row in enumerate(csv.reader(io.StringIO(text, newline='')), 1) if row]
+    line_numbers = [line for line, _ in numbered]
+    rows = [row for _, row in numbered]
+
+    scale = issubclass(cls, ScalePatient)
+    fields = PATIENT_FIELDS + SCALE_FIELDS if scale else PATIENT_FIELDS
+    by_name = csv_columns(fieldnames, rows, [CSV_COLUMNS[field] for field in fields])
+    result = validate_columns({field: by_name[CSV_COLUMNS[field]] for field in fields}, scale, parse=True,
+                              line_numbers=line_numbers)
+    rejected = [RejectedRow(line_numbers[row], dict(zip(fieldnames, rows[row])), result.exceptions(row)[0])
+                for row in result.invalid_rows.tolist()]
+
+    # Only arrays go back to the parent: unpickling one object per patient
+    # would cost about half as much as parsing its row.
+    columns = result.valid_columns()
+    columns["name"] = StringColumn.from_strings(columns["name"])
+    columns["surname"] = StringColumn.from_strings(columns["surname"])
+    batch = PatientBatch(**columns)
+    scores = batch.classify_all() if score and len(batch) else None
+    return batch, scores, rejected, text.count('\n')
+
+
+class LazyPatients:
+    """
+    Read-only sequence of the patients of one parsed range. They are held as a
+    PatientBatch (``batch``) and Patient objects are only built when indexed or
+    iterated.
+    """
+
+    def __init__(self, cls, batch, start_id):
+        self.cls = cls
+        self.batch = batch
+        self.start_id = start_id
+
+    def __len__(self):
+        return len(self.batch)
+
+    def _columns(self, rows):
+        batch = self.batch
+        fields = PATIENT_FIELDS + SCALE_FIELDS if issubclass(self.cls, ScalePatient) else PATIENT_FIELDS
+        columns = []
+        for field in fields:
+            values = getattr(batch, field)
+            if field == "gender":
+                values = np.asarray(GENDERS, dtype=object)[values]
+            elif field == "activity":
+                values = np.asarray(ACTIVITY_LEVELS, dtype=object)[values]
+            elif isinstance(values, StringColumn):
+                strings = values.tolist() if len(rows) == len(values) else None
+                columns.append(strings or [values[row] for row in rows.tolist()])
+                continue
+            columns.append(values[rows].tolist())
+        return columns
+
+    def _build(self, rows):
+        ids = [f"{self.start_id + row:03d}" for row in rows.tolist()]
+        return list(map(self.cls._from_values, ids, *self._columns(rows)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._build(np.arange(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._build(np.array([index]))[0]
+
+    def __iter__(self):
+        return iter(self._build(np.arange(len(self))))
+
+
+def iter_csv_parallel(file_path, cls=Patient, workers=None, errors=None, start_id=1, score=True,
+                      ranges_per_worker=4):
+    """
+    Parse, validate and (optionally) score a CSV file across a process pool. Yields
+    ``(patients, scores)`` per byte range in file order: ``patients`` is a
+    LazyPatients sequence (its ``batch`` holds the columns) and ``scores`` the
+    PatientBatch.classify_all() dict for those patients, or None. Patient IDs are
+    assigned here in file order, so they do not depend on worker scheduling.
+    """
+    workers = workers or os.cpu_count() or 1
+    header, ranges = split_csv(file_path, workers * ranges_per_worker)
+    patient_number = start_id
+    line_offset = 1
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_process_range, file_path, header, start, end, cls, score)
+                   for start, end in ranges]
+        for future in futures:
+            batch, scores, rejected, line_count = future.result()
+            for rejected_row in rejected:
+                if errors is None:
+                    raise ValueError(f"line {rejected_row.line_number + line_offset}: {rejected_row.reason}")
+                rejected_row.line_number += line_offset
+                errors.append(rejected_row)
+            line_offset += line_count
+
+            yield LazyPatients(cls, batch, patient_number), scores
+            patient_number += len(batch)
+
+
+def ingest_csv_parallel(file_path, cls=Patient, workers=None, errors=None, start_id=1, score=True):
+    """
+    Same as iter_csv_parallel but merges every range into one patient list and
+    one dict of score arrays.
+    """
+    all_patients = []
+    all_scores = {}
+    for patients, scores in iter_csv_parallel(file_path, cls, workers, errors, start_id, score):
+        all_patients.extend(patients)
+        for key, values in (scores or {}).items():
+            all_scores.setdefault(key, []).append(values)
+    return all_patients, {key: np.concatenate(parts) for key, parts in all_scores.items()}
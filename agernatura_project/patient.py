@@ -1,5 +1,16 @@
-import matplotlib.pyplot as plt
 import csv
+from operator import attrgetter
+
+from .classification import LABEL_FUNCTIONS, get_engine
+from .instrumentation import instrumented
+from .fields import PATIENT_METRICS, SCALE_FIELDS, SCALE_METRICS
+from .report import PATIENT_VALUES, HealthReport
+
+
+def _pyplot():
+    # matplotlib is only needed by the chart methods, so it is imported on first use.
+    import matplotlib.pyplot as plt
+    return plt
 
 
 
@@ -13,12 +24,47 @@ class ActivityError(Exception):
     """
 
 
+CSV_ROW_ERRORS = (KeyError, ValueError, TypeError, AttributeError, GenderError, ActivityError)
+
+
+class RejectedRow:
+    """
+    A CSV row that could not be turned into a patient.
+    """
+
+    def __init__(self, line_number, row, error):
+        self.line_number = line_number
+        self.row = row
+        self.reason = f"{type(error).__name__}: {error}"
+
+    def __repr__(self):
+        return f"RejectedRow(line {self.line_number}: {self.reason})"
+
+
+ACTIVITY_FACTORS = {
+    "sedentario": 1.2,
+    "poco activo": 1.375,
+    "activo con moderacion": 1.55,
+    "activo con moderación": 1.55,
+    "activo": 1.725,
+    "muy activo": 1.9
+}
+
+
 class Patient:
 
+    __slots__ = ("name", "surname", "age", "gender", "height", "weight", "activity", "waist_circunference",
+                 "patient_id", "_cache")
+
     patient_count = 0
+    # What health_metrics() covers and the attributes it is computed from.
+    HEALTH_METRICS = PATIENT_METRICS
+    _memo_inputs = attrgetter(*PATIENT_VALUES)
 
+    @instrumented("Patient.__init__")
     def __init__(self, name, surname, age, gender, height, weight, activity, waist_circunference):
 
+        self._cache = None
         self.name = name
         self.surname = surname 
         self.age = age
@@ -33,6 +79,7 @@ class Patient:
             self.weight = weight
         self.activity = activity.lower()
         self.waist_circunference = waist_circunference
+        self.patient_id = None
 
         if not isinstance(waist_circunference, (int, float)):
             raise TypeError(f"{waist_circunference} must be a float or integer")
@@ -59,55 +106,144 @@ class Patient:
             raise ActivityError(f"{activity} invalid, must be in ['Sedentario', 'Poco activo', 'Activo con moderacion', 'Activo', 'Muy activo']")
         
     @classmethod
+    @instrumented("create_patients_from_csv")
     def create_patients_from_csv(cls, file_path):
-        with open(file_path, 'r') as file:
+        patients = list(cls.iter_patients_from_csv(file_path, start_id=cls.patient_count + 1))
+        cls.patient_count += len(patients)
+        return patients
+
+    @classmethod
+    def iter_patients_from_csv(cls, file_path, errors=None, start_id=1):
+        """
+        Yield patients one CSV row at a time. Rows that fail to parse or validate are
+        appended to ``errors`` as RejectedRow objects when a sink is given, otherwise
+        the error is raised.
+        """
+        with open(file_path, 'r', newline='') as file:
             reader = csv.DictReader(file)
-            patients = []
+            patient_number = start_id
 
             for row in reader:
-                cls.patient_count += 1
-                patient_id = f"{cls.patient_count:03d}"  
-
-                patient = cls(
-                    row['Name'],
-                    row['Surname'],
-                    int(row['Age']),
-                    row['Gender'],
-                    float(row['Height']),
-                    float(row['Weight']),
-                    row['Activity'],
-                    float(row['WaistCircumference'])
-                )
-
-                patient.patient_id = patient_id
-                patients.append(patient)
-        return patients
-        
-    def get_basal_metabolic_rate(self):
+                try:
+                    patient = cls._from_csv_row(row)
+                except CSV_ROW_ERRORS as e:
+                    if errors is None:
+                        raise
+                    errors.append(RejectedRow(reader.line_num, row, e))
+                    continue
+
+                patient.patient_id = f"{patient_number:03d}"
+                patient_number += 1
+                yield patient
+
+    @classmethod
+    def iter_patient_chunks_from_csv(cls, file_path, chunk_size=1000, errors=None, start_id=1):
+        if chunk_size < 1:
+            raise ValueError(f"{chunk_size} must be a positive value")
+        chunk = []
+        for patient in cls.iter_patients_from_csv(file_path, errors, start_id):
+            chunk.append(patient)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
+    @classmethod
+    @instrumented("csv_row")
+    def _from_csv_row(cls, row):
+        return cls(
+            row['Name'],
+            row['Surname'],
+            int(row['Age']),
+            row['Gender'],
+            float(row['Height']),
+            float(row['Weight']),
+            row['Activity'],
+            float(row['WaistCircumference'])
+        )
+        
+    @classmethod
+    def _from_values(cls, patient_id, name, surname, age, gender, height, weight, activity, waist_circunference):
+        """
+        A patient from values already checked by validation.validate_columns: no
+        check runs again.
+        """
+        patient = cls.__new__(cls)
+        patient._cache = None
+        patient.name = name
+        patient.surname = surname
+        patient.age = age
+        patient.gender = gender
+        patient.height = height
+        patient.weight = weight
+        patient.activity = activity
+        patient.waist_circunference = waist_circunference
+        patient.patient_id = patient_id
+        return patient
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for klass in type(self).__mro__
+                for name in klass.__dict__.get("__slots__", ()) if name != "_cache" and hasattr(self, name)}
+
+    def __setstate__(self, state):
+        self._cache = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def health_metrics(self):
+        """
+        {"basal_metabolic_rate": BMR, metric: category code} for every metric in
+        HEALTH_METRICS. The dict is memoized with the reference tables and the
+        input attributes it was computed from, and reused while one tuple
+        comparison finds them unchanged. Callers must not modify it.
+        """
+        engine = get_engine()
+        inputs = self._memo_inputs(self)
+        cache = self._cache
+        if cache is not None and cache[0] is engine and cache[1] == inputs:
+            return cache[2]
+        metrics = {"basal_metabolic_rate": self.basal_metabolic_rate()}
+        for metric in self.HEALTH_METRICS:
+            metrics[metric] = engine.classify_code(metric, self)
+        self._cache = (engine, inputs, metrics)
+        return metrics
+
+    def basal_metabolic_rate(self):
         if self.gender == 'm':
             bmr = 655 + (9.6 * self.weight) + (1.8 * self.height) - (4.7 * self.age)
         else:
             bmr = 66 + (13.7 * self.weight) + (5 * self.height) - (6.8 * self.age)
-        
-        activity_factors = {
-        "sedentario": 1.2,
-        "poco activo": 1.375,
-        "activo con moderacion": 1.55,
-        "activo con moderación": 1.55,
-        "activo": 1.725,
-        "muy activo": 1.9
-        }
-        
-        if self.activity.lower() in activity_factors:
-            bmr *= activity_factors[self.activity.lower()]
+
+        if self.activity.lower() in ACTIVITY_FACTORS:
+            bmr *= ACTIVITY_FACTORS[self.activity.lower()]
+        return bmr
+
+    @instrumented("get_basal_metabolic_rate")
+    def get_basal_metabolic_rate(self):
+        bmr = self.basal_metabolic_rate()
         print(f"{self.name} {self.surname} necesita {round(bmr, 2)} calorias al día")
         return bmr
-paciente1 = Patient("Maria", "Gonzalez", 30, "m", 169, 82, "sedentario", 142)
-# paciente1.get_basal_metabolic_rate()
+
+    def category_code(self, metric):
+        """
+        Code of ``metric`` in the reference tables (see classification.py).
+        """
+        return get_engine().classify_code(metric, self)
+
+    def category(self, metric):
+        return get_engine().tables[metric].label(self)
 
 
 class ScalePatient(Patient):
+
+    __slots__ = ("mgras_percent", "bone_mass", "muscular_mass_kg", "imc", "metabolic_age", "visceral_gras",
+                 "water_levels")
+
+    HEALTH_METRICS = PATIENT_METRICS + SCALE_METRICS
+    _memo_inputs = attrgetter(*PATIENT_VALUES, *SCALE_FIELDS)
+
+    @instrumented("ScalePatient.__init__")
     def __init__(self, name, surname, age, gender, height, weight, activity, waist_circunference, mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age, visceral_gras, water_levels):
         super().__init__(name, surname, age, gender, height, weight, activity, waist_circunference)
         self.mgras_percent = mgras_percent
@@ -153,373 +289,63 @@ class ScalePatient(Patient):
         if visceral_gras < 0:
             raise ValueError(f"{visceral_gras} must be a positive value")   
         
+    @instrumented("get_cardiovascular_risk")
     def get_cardiovascular_risk(self):
-        if self.gender == 'm':
-
-            if self.waist_circunference < 82:
-                cardiovascular_risk = "Normal"
-            elif self.waist_circunference >= 82 and self.waist_circunference <= 87:
-                cardiovascular_risk = "Elevado"
-            else:
-                cardiovascular_risk = "Muy elevado"
-
-        else:
-
-            if self.waist_circunference < 95:
-                cardiovascular_risk = "Normal"
-            elif self.waist_circunference >= 95 and self.waist_circunference <= 101:
-                cardiovascular_risk = "Elevado"
-            else:
-                cardiovascular_risk = "Muy elevado"
-                
+        cardiovascular_risk = LABEL_FUNCTIONS["cardiovascular_risk"](self)
         return f"Riesgo cardiovascular: {cardiovascular_risk}."
         
+    @instrumented("get_complexion")
     def get_complexion(self):
-        if self.gender == 'm':
-            if self.height >= 155 and self.height < 159:
-                if self.weight < 54:
-                    complexion = "pequeña"
-                elif self.weight < 59:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 160 and self.height < 164:
-                if self.weight < 56:
-                    complexion = "pequeña"
-                elif self.weight < 61:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 165 and self.height < 169:
-                if self.weight < 59:
-                    complexion = "pequeña"
-                elif self.weight < 64:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 170 and self.height <= 175:
-                if self.weight < 65:
-                    complexion = "pequeña"
-                elif self.weight < 69:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            else:
-                complexion = "No se puede determinar la complexión"
-
-        else:
-            if self.height >= 170 and self.height < 174:
-                if self.weight < 66:
-                    complexion = "pequeña"
-                elif self.weight < 70:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 175 and self.height < 179:
-                if self.weight < 69:
-                    complexion = "pequeña"
-                elif self.weight < 73:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 180 and self.height < 184:
-                if self.weight < 71:
-                    complexion = "pequeña"
-                elif self.weight < 76:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            elif self.height >= 185 and self.height <= 190:
-                if self.weight < 76:
-                    complexion = "pequeña"
-                elif self.weight < 85:
-                    complexion = "mediana"
-                else:
-                    complexion = "grande"
-            else:
-                complexion = "No se puede determinar la complexión"
-
+        complexion = LABEL_FUNCTIONS["complexion"](self)
         return f"su complexion es {complexion}."
-
-
-        
-        
     
+    @instrumented("get_imc_standard")
     def get_imc_standard(self):
-        if self.imc < 18.5:
-            imc_standard = "Peso insuficiente"
-        elif self.imc >= 18.5 and self.imc < 25:
-            imc_standard = "Normopeso"
-        elif self.imc >= 25 and self.imc < 27:
-            imc_standard = "Sobrepeso grado I"
-        elif self.imc >= 27 and self.imc < 30:
-            imc_standard = "Sobrepeso grado II (preobesidad)"
-        elif self.imc >= 30 and self.imc < 35:
-            imc_standard = "Obesidad de tipo I"
-        elif self.imc >= 35 and self.imc < 40:
-            imc_standard = "Obesidad de tipo II"
-        elif self.imc >= 40 and self.imc < 50:
-            imc_standard = "Obesidad de tipo III (mórbida)"
-        else:
-            imc_standard = "Obesidad de tipo IV (extrema)"
-        
+        imc_standard = LABEL_FUNCTIONS["imc_standard"](self)
         return f"Su clasificación segun su IMC es: {imc_standard}."
-        
-        
     
+    @instrumented("get_mgras_percent")
     def get_mgras_percent(self):
-        if self.gender == 'm':
-            if self.age <= 20:
-                if self.mgras_percent < 16:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 22:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 30:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 25:
-                if self.mgras_percent < 18.5:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 25:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 31:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 30:
-                if self.mgras_percent < 19:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 25:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 32:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 35:
-                if self.mgras_percent < 19:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 25:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 33:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 40:
-                if self.mgras_percent < 22:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 28:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 33:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 45:
-                if self.mgras_percent < 23:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 28:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 35:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 50:
-                if self.mgras_percent < 23:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 29:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 35:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 55:
-                if self.mgras_percent < 24:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 30:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 36:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            else:
-                if self.mgras_percent < 25:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 31:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 38:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-        else:
-            if self.age <= 20:
-                if self.mgras_percent < 4:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 14:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 19:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 25:
-                if self.mgras_percent < 5:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 14.5:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 22:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 30:
-                if self.mgras_percent < 8.5:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 17:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 23:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 35:
-                if self.mgras_percent < 9.5:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 18:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 24:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 40:
-                if self.mgras_percent < 10.5:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 19:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 25:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 45:
-                if self.mgras_percent < 14:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 22:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 27:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 50:
-                if self.mgras_percent < 15:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 23:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 28:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            if self.age <= 55:
-                if self.mgras_percent < 16:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 24:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 29:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-            else:
-                if self.mgras_percent < 17:
-                    bodyfat_status = "Delgado"
-                elif self.mgras_percent < 25:
-                    bodyfat_status = "Ideal"
-                elif self.mgras_percent < 31:
-                    bodyfat_status = "Promedio"
-                else:
-                    bodyfat_status = "Superior al promedio"
-        
+        bodyfat_status = LABEL_FUNCTIONS["mgras_percent"](self)
         return f"Su porcentaje de grasa corporal es: {bodyfat_status}."
-        
-        
     
+    @instrumented("get_w_level")
     def get_w_level(self):
-        if self.gender == 'm':
-            if 44 <= self.water_levels <= 61:
-                w_level = "saludables"
-            elif self.water_levels < 44:
-                w_level = "inferiores al promedio"
-            else:
-                w_level = "superiores al promedio"
-        else:
-            if 49 <= self.water_levels <= 66:
-                w_level = "saludables"
-            elif self.water_levels < 49:
-                w_level = "inferiores al promedio"
-            else:
-                w_level = "superiores al promedio"
-        
+        w_level = LABEL_FUNCTIONS["w_level"](self)
         return f"Sus niveles de agua son {w_level}."
         
-        
-        
+    @instrumented("get_im_muscular")
     def get_im_muscular(self):
-        if self.gender == 'm':
-            if self.age <= 30:
-                if self.muscular_mass_kg < 35:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 35 and self.muscular_mass_kg <= 41:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-            if self.age <= 60:
-                if self.muscular_mass_kg < 33:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 33 and self.muscular_mass_kg <= 38:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-            else:
-                if self.muscular_mass_kg < 28:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 28 and self.muscular_mass_kg <= 33:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-        else:
-            if self.age <= 30:
-                if self.muscular_mass_kg < 43:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 43 and self.muscular_mass_kg <= 56:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-            if self.age <= 60:
-                if self.muscular_mass_kg < 40:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 40 and self.muscular_mass_kg <= 50:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-            else:
-                if self.muscular_mass_kg < 38:
-                    im_muscular = "Baja"
-                elif self.muscular_mass_kg >= 38 and self.muscular_mass_kg <= 57:
-                    im_muscular = "Normal"
-                else:
-                    im_muscular = "Excesiva"
-        
+        im_muscular = LABEL_FUNCTIONS["im_muscular"](self)
         return f"Su masa muscular es: {im_muscular}."
-        
-        
     
+    @instrumented("get_ev_gv")
     def get_ev_gv(self):
-        if self.visceral_gras < 5:
-            ev_gv = "Bien"
-        elif self.visceral_gras < 9:
-            ev_gv = "Medio"
-        elif self.visceral_gras < 13:
-            ev_gv = "Exceso"
-        else:
-            ev_gv = "Alarmante"
-        
+        ev_gv = LABEL_FUNCTIONS["ev_gv"](self)
         return f"Su evaluación de grasa visceral es: {ev_gv}."
     
 
+    @classmethod
+    @instrumented("csv_row")
+    def _from_csv_row(cls, row):
+        return cls(
+            row['Name'],
+            row['Surname'],
+            int(row['Age']),
+            row['Gender'],
+            float(row['Height']),
+            float(row['Weight']),
+            row['Activity'],
+            float(row['WaistCircumference']),
+            float(row['MgrasPercent']),
+            float(row['BoneMass']),
+            float(row['MuscularMassKg']),
+            float(row['IMC']),
+            float(row['MetabolicAge']),
+            float(row['VisceralGras']),
+            float(row['WaterLevels'])
+        )
+
     @classmethod
     def add_patient(cls, patient_obj, waist_circunference, mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age, visceral_gras, water_levels):
         name = patient_obj.name
@@ -546,159 +372,101 @@ class ScalePatient(Patient):
                           visceral_gras,
                           water_levels
                           )
-        
+        new_patient.patient_id = patient_obj.patient_id
+
         return new_patient
-    
-    def get_imc_graf(self):
-        limites_imc = [0, 18.5, 25, 30, 35, 50, 60]
-        colores_imc = ['#E0E0E0', '#7FFF7F', 'yellow', 'orange', '#FF9999', 'red']
-        etiquetas_imc = ['Bajo peso', 'Peso normal', 'Sobrepeso', 'Obesidad I', 'Obesidad II',
-                 'Obesidad III']
 
-        
-        imc_paciente = self.imc
-        
-        fig, ax = plt.subplots(figsize = (6,3))
-        
-        for i in range(len(limites_imc) - 1):
-            ax.barh(0, limites_imc[i + 1] - limites_imc[i], left=limites_imc[i], height=0.5,
-                    color=colores_imc[i], edgecolor='black', label = etiquetas_imc[i])
-        
-        ax.scatter(imc_paciente, 0, color='white', marker='o', s=50, edgecolor='black')
-        ax.text(imc_paciente, 0.18, f'{self.name}', ha='center', va='center', color='black', fontsize=10,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.3'))
-
-        ax.set_xlim(0, 60)
-        ax.set_ylim(-1, 1)
-        ax.set_xticks([10, 20, 30, 40, 50, 60])
-        ax.set_yticks([]) 
-        ax.set_xlabel('IMC')
-        ax.set_title(f"Barra de IMC: '{self.name} {self.surname}'")
-        
-        ax.legend(loc = 'upper left', bbox_to_anchor = (1, 1))
-        
+    @classmethod
+    def _from_values(cls, patient_id, name, surname, age, gender, height, weight, activity, waist_circunference,
+                     mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age, visceral_gras, water_levels):
+        patient = super()._from_values(patient_id, name, surname, age, gender, height, weight, activity,
+                                       waist_circunference)
+        patient.mgras_percent = mgras_percent
+        patient.bone_mass = bone_mass
+        patient.muscular_mass_kg = muscular_mass_kg
+        patient.imc = imc
+        patient.metabolic_age = metabolic_age
+        patient.visceral_gras = visceral_gras
+        patient.water_levels = water_levels
+        return patient
+
+    @classmethod
+    def _from_validated(cls, patient_obj, waist_circunference, mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age, visceral_gras, water_levels):
+        """
+        Like add_patient, for a Patient that is already validated and scale values
+        checked by validation.validate_scale_columns: no check runs again.
+        """
+        return cls._from_values(patient_obj.patient_id, patient_obj.name, patient_obj.surname, patient_obj.age,
+                                patient_obj.gender, patient_obj.height, patient_obj.weight, patient_obj.activity,
+                                waist_circunference, mgras_percent, bone_mass, muscular_mass_kg, imc, metabolic_age,
+                                visceral_gras, water_levels)
+
+    def _show_graf(self, kind):
+        from .charts import CHART_SPECS, FIGSIZE, draw_gauge
+
+        plt = _pyplot()
+        fig, ax = plt.subplots(figsize = FIGSIZE)
+        draw_gauge(ax, kind, getattr(self, CHART_SPECS[kind]["attribute"]), self.name, self.surname)
+
         plt.tight_layout()
         plt.show()
+
+    @instrumented("get_imc_graf")
+    def get_imc_graf(self):
+        self._show_graf("imc")
         
+    @instrumented("get_gc_graf")
     def get_gc_graf(self):
-        limites_gc = [0, 23, 35, 41, 50]
-        colores_gc = ["#E0E0E0", "#7FFF7F", "yellow", "#FF9999"]
-        etiquetas_gc = ["Bajo grasa", "saludable", "alto grasa", "obeso"]
-        gc_paciente = self.mgras_percent        
-        fig, ax = plt.subplots(figsize = (6,3))
-        
-        for i in range(len(limites_gc) - 1):
-            ax.barh(0, limites_gc[i + 1] - limites_gc[i], left=limites_gc[i], height=0.5,
-                    color=colores_gc[i], edgecolor='black', label = etiquetas_gc[i])
-        
-        ax.scatter(gc_paciente, 0, color='white', marker='o', s=50, edgecolor='black')
-        ax.text(gc_paciente, 0.18, f'{self.name}', ha='center', va='center', color='black', fontsize=10,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.3'))
-
-        ax.set_xlim(0, 50)
-        ax.set_ylim(-1, 1)
-        ax.set_xticks([10, 20, 30, 40, 50])
-        ax.set_yticks([]) 
-        ax.set_xlabel(f"% Grasa Corporal")
-        ax.set_title(f"% Grasa Corporal: '{self.name} {self.surname}'")
-        
-        ax.legend(loc = 'upper left', bbox_to_anchor = (1, 1))
-        
-        plt.tight_layout()
-        plt.show()
+        self._show_graf("gc")
         
+    @instrumented("get_wl_graf")
     def get_wl_graf(self):
-        limites_wl = [0, 44, 66, 80]
-        colores_wl = ["#E0E0E0", "#7FFF7F", "#E0E0E0"]
-        etiquetas_wl = ["Bajo", "saludable", "Alto"]
-        wl_paciente = self.water_levels       
-        fig, ax = plt.subplots(figsize = (6,3))
-        
-        for i in range(len(limites_wl) - 1):
-            ax.barh(0, limites_wl[i + 1] - limites_wl[i], left=limites_wl[i], height=0.5,
-                    color=colores_wl[i], edgecolor='black', label = etiquetas_wl[i])
-        
-        ax.scatter(wl_paciente, 0, color='white', marker='o', s=50, edgecolor='black')
-        ax.text(wl_paciente, 0.18, f'{self.name}', ha='center', va='center', color='black', fontsize=10,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.3'))
-
-        ax.set_xlim(30, 80)
-        ax.set_ylim(-1, 1)
-        ax.set_xticks([30, 45, 50, 60, 65, 80])
-        ax.set_yticks([]) 
-        ax.set_xlabel(f"% Agua Corporal")
-        ax.set_title(f"% Agua Corporal: '{self.name} {self.surname}'")
-        
-        ax.legend(loc = 'upper left', bbox_to_anchor = (1, 1))
-        
-        plt.tight_layout()
-        plt.show()
+        self._show_graf("wl")
         
+    @instrumented("get_cvrisk_graf")
     def get_cvrisk_graf(self):
-        limites_cv = [0, 5, 9, 13, 17, 21]
-        colores_cv = ["#7FFF7F", "yellow", "orange", "#FF9999", "red"]
-        etiquetas_cv = ["Ninguno", "Aumentado", "Alto", "Muy alto", "Extremo"]
-        cv_paciente = self.visceral_gras       
-        fig, ax = plt.subplots(figsize = (6,3))
-        
-        for i in range(len(limites_cv) - 1):
-            ax.barh(0, limites_cv[i + 1] - limites_cv[i], left=limites_cv[i], height=0.5,
-                    color=colores_cv[i], edgecolor='black', label = etiquetas_cv[i])
-        
-        ax.scatter(cv_paciente, 0, color='white', marker='o', s=50, edgecolor='black')
-        ax.text(cv_paciente, 0.18, f'{self.name}', ha='center', va='center', color='black', fontsize=10,
-                bbox=dict(facecolor='white', edgecolor='black', boxstyle='round,pad=0.3'))
-
-        ax.set_xlim(0, 21)
-        ax.set_ylim(-1, 1)
-        ax.set_xticks([])
-        ax.set_yticks([]) 
-        ax.set_xlabel(f"Riesgo Cardiovascular")
-        ax.set_title(f"Riesgo Cardiovascular: '{self.name} {self.surname}'")
-        
-        ax.legend(loc = 'upper left', bbox_to_anchor = (1, 1))
-        
+        self._show_graf("cvrisk")
+    
+    @instrumented("get_dashboard_graf")
+    def get_dashboard_graf(self):
+        from .charts import CHART_KINDS, DASHBOARD_FIGSIZE, draw_dashboard
+
+        plt = _pyplot()
+        fig, axes = plt.subplots(len(CHART_KINDS), 1, figsize = DASHBOARD_FIGSIZE)
+        draw_dashboard(fig, axes, self)
+
         plt.tight_layout()
         plt.show()
-    
+
     def generate_all_graphs(self):
         self.get_imc_graf()
         self.get_gc_graf()
         self.get_wl_graf()
         self.get_cvrisk_graf()
         
+@instrumented("run_health_checks")
 def run_health_checks(patient):
     try:
-        patient.get_basal_metabolic_rate()
-        print("----------------------------------------")
-        print(patient.get_cardiovascular_risk())
-        print("----------------------------------------")
-        print(patient.get_complexion())
-        print("----------------------------------------")
-        print(patient.get_imc_standard())
-        print("----------------------------------------")
-        print(patient.get_mgras_percent())
-        print("----------------------------------------")
-        print(patient.get_w_level())
-        print("----------------------------------------")
-        print(patient.get_im_muscular())
-        print("----------------------------------------")
-        print(patient.get_ev_gv())
+        print(HealthReport.from_patient(patient).render())
     except (ValueError, TypeError, GenderError, ActivityError) as e:
         print(f"Error: {e}")
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
 
-paciente1_bascula = ScalePatient.add_patient(paciente1, 142, 35.2, 2.4, 38, 29.5, 52, 12, 42)
-
+def main():
+    paciente1 = Patient("Maria", "Gonzalez", 30, "m", 169, 82, "sedentario", 142)
+    # paciente1.get_basal_metabolic_rate()
 
-# run_health_checks(paciente1_bascula)
-# paciente1_bascula.generate_all_graphs()
+    paciente1_bascula = ScalePatient.add_patient(paciente1, 142, 35.2, 2.4, 38, 29.5, 52, 12, 42)
 
-# paciente1_bascula.get_imc_graf()
-# paciente1_bascula.get_gc_graf()
-# paciente1_bascula.get_wl_graf()
-paciente1_bascula.get_cvrisk_graf()
+    # run_health_checks(paciente1_bascula)
+    # paciente1_bascula.generate_all_graphs()
 
+    # paciente1_bascula.get_imc_graf()
+    # paciente1_bascula.get_gc_graf()
+    # paciente1_bascula.get_wl_graf()
+    paciente1_bascula.get_cvrisk_graf()
 
 
+if __name__ == "__main__":
+    main()
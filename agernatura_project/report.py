@@ -0,0 +1,271 @@
+import csv
+import io
+import json
+import re
+import unicodedata
+from enum import IntEnum
+
+from .classification import get_engine
+from .fields import PATIENT_FIELDS, PATIENT_METRICS, SCALE_FIELDS, SCALE_METRICS
+
+
+class CardiovascularRisk(IntEnum):
+    NORMAL = 0
+    ELEVATED = 1
+    VERY_HIGH = 2
+
+
+class Complexion(IntEnum):
+    SMALL = 0
+    MEDIUM = 1
+    LARGE = 2
+    UNDETERMINED = 3
+
+
+class ImcClass(IntEnum):
+    UNDERWEIGHT = 0
+    NORMAL = 1
+    OVERWEIGHT_I = 2
+    OVERWEIGHT_II = 3
+    OBESITY_I = 4
+    OBESITY_II = 5
+    OBESITY_III = 6
+    OBESITY_IV = 7
+
+
+class BodyFat(IntEnum):
+    LEAN = 0
+    IDEAL = 1
+    AVERAGE = 2
+    ABOVE_AVERAGE = 3
+
+
+class WaterLevel(IntEnum):
+    LOW = 0
+    HEALTHY = 1
+    HIGH = 2
+
+
+class MuscleMass(IntEnum):
+    LOW = 0
+    NORMAL = 1
+    EXCESSIVE = 2
+
+
+class VisceralFat(IntEnum):
+    GOOD = 0
+    MEDIUM = 1
+    EXCESS = 2
+    ALARMING = 3
+
+
+METRIC_ENUMS = {
+    "cardiovascular_risk": CardiovascularRisk,
+    "complexion": Complexion,
+    "imc_standard": ImcClass,
+    "mgras_percent": BodyFat,
+    "w_level": WaterLevel,
+    "im_muscular": MuscleMass,
+    "ev_gv": VisceralFat,
+}
+# metric -> (engine, IntEnum) of the categories in the active reference tables.
+_category_enums = {}
+
+# Every Patient field but the name.
+PATIENT_VALUES = tuple(field for field in PATIENT_FIELDS if field not in ("name", "surname"))
+
+SEPARATOR = "----------------------------------------"
+TEXTS = {
+    "es": {
+        "basal_metabolic_rate": "{name} {surname} necesita {bmr} calorias al día",
+        "cardiovascular_risk": "Riesgo cardiovascular: {}.",
+        "complexion": "su complexion es {}.",
+        "imc_standard": "Su clasificación segun su IMC es: {}.",
+        "mgras_percent": "Su porcentaje de grasa corporal es: {}.",
+        "w_level": "Sus niveles de agua son {}.",
+        "im_muscular": "Su masa muscular es: {}.",
+        "ev_gv": "Su evaluación de grasa visceral es: {}.",
+    },
+    "en": {
+        "basal_metabolic_rate": "{name} {surname} needs {bmr} calories per day",
+        "cardiovascular_risk": "Cardiovascular risk: {}.",
+        "complexion": "Body frame: {}.",
+        "imc_standard": "BMI class: {}.",
+        "mgras_percent": "Body fat: {}.",
+        "w_level": "Water levels: {}.",
+        "im_muscular": "Muscle mass: {}.",
+        "ev_gv": "Visceral fat: {}.",
+    },
+}
+
+
+def _member_name(label):
+    ascii_label = unicodedata.normalize("NFKD", label).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Za-z0-9]+", "_", ascii_label).strip("_").upper() or "CATEGORY"
+
+
+def category_enum(metric):
+    """
+    IntEnum of the categories of ``metric`` in the active reference tables. The
+    default tables use the enums above; tables loaded with load_reference_tables
+    with another number of labels get an enum named after their labels.
+    """
+    engine = get_engine()
+    cached = _category_enums.get(metric)
+    if cached is not None and cached[0] is engine:
+        return cached[1]
+    labels = engine.labels(metric)
+    enum = METRIC_ENUMS[metric]
+    if len(labels) != len(enum):
+        names = {}
+        for code, label in enumerate(labels):
+            name = _member_name(label)
+            names[f"{name}_{code}" if name in names else name] = code
+        enum = IntEnum(enum.__name__, names)
+    _category_enums[metric] = (engine, enum)
+    return enum
+
+
+def _label(metric, category, language):
+    if language == "es":
+        # Spanish labels come from the reference tables, so reloaded tables
+        # are reflected in the text.
+        return get_engine().labels(metric)[category]
+    return category.name.replace("_", " ").lower()
+
+
+class HealthReport:
+    """
+    Print-free result of the health checks of one patient: BMR, the measured
+    values and one IntEnum category per classifier. Text is only produced by
+    render().
+    """
+
+    __slots__ = ("patient_id", "name", "surname", "basal_metabolic_rate", "values", "categories")
+
+    def __init__(self, patient_id, name, surname, basal_metabolic_rate, values, categories):
+        self.patient_id = patient_id
+        self.name = name
+        self.surname = surname
+        self.basal_metabolic_rate = basal_metabolic_rate
+        self.values = values
+        self.categories = categories
+
+    @classmethod
+    def from_patient(cls, patient):
+        fields = PATIENT_VALUES + SCALE_FIELDS if hasattr(patient, "water_levels") else PATIENT_VALUES
+        metrics = patient.health_metrics()
+        return cls(
+            patient.patient_id,
+            patient.name,
+            patient.surname,
+            metrics["basal_metabolic_rate"],
+            {field: getattr(patient, field) for field in fields},
+            {metric: category_enum(metric)(metrics[metric]) for metric in patient.HEALTH_METRICS},
+        )
+
+    def render(self, language="es"):
+        """
+        The report as text, one sentence per check. In Spanish this is exactly
+        what run_health_checks prints.
+        """
+        texts = TEXTS[language]
+        lines = [texts["basal_metabolic_rate"].format(
+            name=self.name, surname=self.surname, bmr=round(self.basal_metabolic_rate, 2))]
+        for metric, category in self.categories.items():
+            lines.append(SEPARATOR)
+            lines.append(texts[metric].format(_label(metric, category, language)))
+        return "\n".join(lines)
+
+    def as_dict(self, labels=False):
+        row = {"patient_id": self.patient_id, "name": self.name, "surname": self.surname,
+               "basal_metabolic_rate": self.basal_metabolic_rate}
+        row.update(self.values)
+        for metric, category in self.categories.items():
+            row[f"{metric}_code"] = int(category)
+            if labels:
+                row[f"{metric}_label"] = get_engine().labels(metric)[category]
+        return row
+
+
+def build_reports(patients):
+    """
+    HealthReports of many patients, classified together with PatientBatch
+    (patients with and without scale readings as separate batches). A patient
+    that cannot be classified gets the exception instead of a report.
+    """
+    from .batch import PatientBatch
+    from .patient import CSV_ROW_ERRORS
+
+    reports = [None] * len(patients)
+    for has_scale_data in (True, False):
+        indexes = [i for i, p in enumerate(patients) if hasattr(p, "water_levels") == has_scale_data]
+        if not indexes:
+            continue
+        group = [patients[i] for i in indexes]
+        try:
+            results = PatientBatch.from_patients(group).classify_all()
+        except ValueError:
+            # One patient the batch cannot classify must not fail the others.
+            for i in indexes:
+                try:
+                    reports[i] = HealthReport.from_patient(patients[i])
+                except CSV_ROW_ERRORS as e:
+                    reports[i] = e
+            continue
+        enums = {metric: category_enum(metric) for metric in (PATIENT_METRICS + SCALE_METRICS if has_scale_data else PATIENT_METRICS)}
+        fields = PATIENT_VALUES + SCALE_FIELDS if has_scale_data else PATIENT_VALUES
+        for row, i in enumerate(indexes):
+            patient = patients[i]
+            try:
+                reports[i] = HealthReport(
+                    patient.patient_id, patient.name, patient.surname,
+                    float(results["basal_metabolic_rate"][row]),
+                    {field: getattr(patient, field) for field in fields},
+                    {metric: enum(int(results[metric][row])) for metric, enum in enums.items()},
+                )
+            except CSV_ROW_ERRORS as e:
+                reports[i] = e
+    return reports
+
+
+def export_reports(reports, target, format="csv", labels=False, buffer_size=1 << 20, flush_every=1000):
+    """
+    Stream reports (or patients, converted one at a time) to a CSV or JSON Lines
+    file path or text file object. Rows are written through a buffer of
+    ``buffer_size`` bytes in groups of ``flush_every``. Returns the row count.
+    """
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"{format} invalid, must be in ['csv', 'jsonl']")
+    if isinstance(target, str):
+        with open(target, 'w', newline='', encoding='utf-8', buffering=buffer_size) as file:
+            return export_reports(reports, file, format, labels, buffer_size, flush_every)
+
+    columns = ["patient_id", "name", "surname", "basal_metabolic_rate"]
+    columns += list(PATIENT_VALUES + SCALE_FIELDS)
+    columns += [f"{metric}_code" for metric in PATIENT_METRICS + SCALE_METRICS]
+    if labels:
+        columns += [f"{metric}_label" for metric in PATIENT_METRICS + SCALE_METRICS]
+
+    pending = io.StringIO()
+    writer = csv.DictWriter(pending, columns, restval="") if format == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+
+    count = 0
+    for report in reports:
+        if not isinstance(report, HealthReport):
+            report = HealthReport.from_patient(report)
+        row = report.as_dict(labels)
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            pending.write(json.dumps(row, ensure_ascii=False))
+            pending.write("\n")
+        count += 1
+        if count % flush_every == 0:
+            target.write(pending.getvalue())
+            pending.seek(0)
+            pending.truncate()
+    target.write(pending.getvalue())
+    return count
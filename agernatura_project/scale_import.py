@@ -0,0 +1,70 @@
+import csv
+from itertools import compress, islice
+
+from .fields import SCALE_FIELDS
+from .patient import RejectedRow, ScalePatient
+from .validation import CSV_COLUMNS, csv_columns, validate_scale_columns
+
+
+PATIENT_ID_COLUMN = "PatientId"
+SCALE_IMPORT_FIELDS = ("waist_circunference",) + SCALE_FIELDS
+
+
+def iter_scale_import(file_path, patients, batch_size=1000, errors=None, cls=ScalePatient):
+    """
+    Join a scale export (a PatientId column plus the ScalePatient CSV columns,
+    WaistCircumference included) to already validated patients and yield lists
+    of up to ``batch_size`` ScalePatients.
+
+    ``patients`` is a list of patients or a dict keyed by patient_id. Only the
+    scale values are validated, a batch of rows at a time, and the records are
+    built without running the constructors again. Rows with an unknown
+    patient_id or invalid values are appended to ``errors`` as RejectedRow
+    objects when a sink is given, otherwise the error is raised.
+    """
+    index = patients if isinstance(patients, dict) else {p.patient_id: p for p in patients}
+    names = [PATIENT_ID_COLUMN] + [CSV_COLUMNS[field] for field in SCALE_IMPORT_FIELDS]
+    build = cls._from_validated
+
+    with open(file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        # Blank lines are skipped, as DictReader does; line_num stays right
+        # because filter hands on each row as soon as it is read.
+        data_rows = filter(None, reader)
+        while True:
+            rows = []
+            line_numbers = []
+            for row in islice(data_rows, batch_size):
+                rows.append(row)
+                line_numbers.append(reader.line_num)
+            if not rows:
+                break
+
+            by_name = csv_columns(header, rows, names)
+            columns = {field: by_name[CSV_COLUMNS[field]] for field in SCALE_IMPORT_FIELDS}
+            result = validate_scale_columns(columns, parse=True, line_numbers=line_numbers)
+            values = [result.parsed[field].tolist() for field in SCALE_IMPORT_FIELDS]
+            matched = [index.get(patient_id) for patient_id in by_name[PATIENT_ID_COLUMN]]
+
+            keep = [patient is not None and valid for patient, valid in zip(matched, result.valid.tolist())]
+            batch = list(map(build, compress(matched, keep), *(compress(column, keep) for column in values)))
+
+            for row_index in [i for i, kept in enumerate(keep) if not kept]:
+                if matched[row_index] is None:
+                    error = KeyError(f"Unknown patient_id {by_name[PATIENT_ID_COLUMN][row_index]}")
+                else:
+                    error = result.exceptions(row_index)[0]
+                if errors is None:
+                    raise error
+                errors.append(RejectedRow(line_numbers[row_index], dict(zip(header, rows[row_index])), error))
+            if batch:
+                yield batch
+
+
+def import_scale_readings(file_path, patients, errors=None, cls=ScalePatient):
+    """
+    Every ScalePatient of a scale export, see iter_scale_import.
+    """
+    return [scale_patient for batch in iter_scale_import(file_path, patients, errors=errors, cls=cls)
+            for scale_patient in batch]
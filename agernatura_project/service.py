@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from http import HTTPStatus
+
+from .fields import PATIENT_FIELDS, SCALE_FIELDS
+from .patient import CSV_ROW_ERRORS, Patient, ScalePatient
+from .report import build_reports
+
+
+MAX_BATCH = 256
+MAX_DELAY = 0.005
+QUEUE_SIZE = 4096
+MAX_BODY = 1 << 20
+LATENCY_WINDOW = 10_000
+
+
+def _patient_from_reading(reading):
+    if not isinstance(reading, dict):
+        raise TypeError(f"{reading} must be a JSON object.")
+    cls = ScalePatient if any(field in reading for field in SCALE_FIELDS) else Patient
+    fields = PATIENT_FIELDS + SCALE_FIELDS if cls is ScalePatient else PATIENT_FIELDS
+    patient = cls(*(reading[field] for field in fields))
+    patient.patient_id = reading.get("patient_id")
+    return patient
+
+
+class ServiceMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.readings = 0
+        self.invalid_readings = 0
+        self.rejected_requests = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self, queue_depth):
+        uptime = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+        return {
+            "uptime_s": uptime,
+            "requests": self.requests,
+            "readings": self.readings,
+            "invalid_readings": self.invalid_readings,
+            "rejected_requests": self.rejected_requests,
+            "batches": self.batches,
+            "mean_batch_size": self.readings / self.batches if self.batches else None,
+            "readings_per_s": self.readings / uptime if uptime else None,
+            "queue_depth": queue_depth,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+class IntakeService:
+    """
+    Local HTTP/JSON intake of patient readings.
+
+    POST /readings takes one reading or a list of readings (objects keyed by the
+    Patient/ScalePatient argument names, plus an optional patient_id) and
+    answers {"results": [...]}, one report dict or {"error": ...} per reading.
+    Readings from all connections are queued and classified in micro-batches of
+    up to ``max_batch`` readings, waiting at most ``max_delay`` seconds to fill
+    one. When the queue has no room for a request it is answered with 503 and
+    Retry-After instead of being buffered; a request with more readings than
+    the whole queue holds could never fit and is answered with 413. GET /metrics reports throughput,
+    latency percentiles, batch sizes and queue depth.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, max_batch=MAX_BATCH, max_delay=MAX_DELAY,
+                 queue_size=QUEUE_SIZE, max_body=MAX_BODY):
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_body = max_body
+        self.queue = asyncio.Queue(queue_size)
+        self.metrics = ServiceMetrics()
+        self.server = None
+        self._batcher = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._batcher = asyncio.create_task(self._run_batcher())
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(items) < self.max_batch:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    items.append(self.queue.get_nowait())
+
+            try:
+                reports = build_reports([patient for patient, _ in items])
+            except Exception as e:
+                reports = [e] * len(items)
+            self.metrics.batches += 1
+            for (_, future), report in zip(items, reports):
+                if not future.done():
+                    future.set_result(report)
+
+    async def submit(self, readings):
+        """
+        Structured results for a list of readings, in order. Raises
+        asyncio.QueueFull when the queue has no room for all of them.
+        """
+        results = [None] * len(readings)
+        pending = []
+        for index, reading in enumerate(readings):
+            try:
+                pending.append((index, _patient_from_reading(reading)))
+            except CSV_ROW_ERRORS as e:
+                results[index] = {"error": f"{type(e).__name__}: {e}"}
+                self.metrics.invalid_readings += 1
+
+        if self.queue.maxsize and self.queue.maxsize - self.queue.qsize() < len(pending):
+            raise asyncio.QueueFull
+        loop = asyncio.get_running_loop()
+        futures = []
+        for index, patient in pending:
+            future = loop.create_future()
+            self.queue.put_nowait((patient, future))
+            futures.append((index, future))
+
+        for index, future in futures:
+            report = await future
+            if isinstance(report, Exception):
+                results[index] = {"error": f"{type(report).__name__}: {report}"}
+                self.metrics.invalid_readings += 1
+            else:
+                results[index] = report.as_dict(labels=True)
+                self.metrics.readings += 1
+        return results
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode('latin-1').partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > self.max_body:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large."},
+                                        close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, extra = await self._dispatch(method, path, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, extra, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, self.metrics.snapshot(self.queue.qsize()), None
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}, None
+        if path != "/readings":
+            return HTTPStatus.NOT_FOUND, {"error": f"{path} not found."}, None
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST."}, None
+
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        try:
+            readings = json.loads(body)
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON: {e}"}, None
+        if isinstance(readings, dict):
+            readings = [readings]
+        if not isinstance(readings, list):
+            return HTTPStatus.BAD_REQUEST, {"error": "Send a reading or a list of readings."}, None
+        if self.queue.maxsize and len(readings) > self.queue.maxsize:
+            return (HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                    {"error": f"At most {self.queue.maxsize} readings per request.", "max_readings": self.queue.maxsize},
+                    None)
+        try:
+            results = await self.submit(readings)
+        except asyncio.QueueFull:
+            self.metrics.rejected_requests += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Intake queue is full, retry later."}, {"Retry-After": "1"}
+        self.metrics.latencies.append(time.perf_counter() - start)
+        return HTTPStatus.OK, {"results": results}, None
+
+    async def _respond(self, writer, status, payload, extra_headers=None, close=False):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(body)}"]
+        if close:
+            head.append("Connection: close")
+        for key, value in (extra_headers or {}).items():
+            head.append(f"{key}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+
+class IntakeClient:
+    """
+    Minimal keep-alive HTTP/JSON client for a local IntakeService.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def __aenter__(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def request(self, method, path, payload=None):
+        """
+        (status, decoded JSON body) of one request.
+        """
+        body = b"" if payload is None else json.dumps(payload).encode('utf-8')
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode('latin-1')
+                          + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode('latin-1').partition(":")
+            if key.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def send_readings(self, readings):
+        return await self.request("POST", "/readings", readings)
+
+    async def metrics(self):
+        return (await self.request("GET", "/metrics"))[1]
+
+
+async def _serve(host, port, max_batch, max_delay, queue_size):
+    service = await IntakeService(host, port, max_batch, max_delay, queue_size).start()
+    print(f"Intake service listening on http://{service.host}:{service.port}")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON intake service for patient readings.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port, args.max_batch, args.max_delay, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import heapq
+
+import numpy as np
+
+from .batch import PatientBatch, _encode
+from .fields import ACTIVITY_ALIASES, ACTIVITY_LEVELS, GENDERS
+
+
+FEATURES = ("age", "imc", "mgras_percent", "muscular_mass_kg", "visceral_gras", "water_levels")
+# Large leaves keep the Python work per query small; numpy scans the leaves.
+LEAF_SIZE = 256
+# The tree is rebuilt once the insert buffer or the deleted rows reach this
+# fraction of the rows in the tree, and at least MIN_REBUILD rows once the tree
+# has that many. Smaller indexes rebuild sooner so their normalization follows
+# the data from the first insert.
+REBUILD_RATIO = 0.25
+MIN_REBUILD = 256
+
+
+class KDTree:
+    """
+    Static KD-tree over the rows of ``points``. Nodes are stored in flat arrays:
+    the rows of node i are ``order[start[i]:end[i]]``, leaves have left == -1,
+    and every node keeps the bounding box of its rows for pruning.
+    """
+
+    def __init__(self, order, start, end, left, right, lower, upper):
+        self.order = order
+        self.start = start
+        self.end = end
+        self.left = left
+        self.right = right
+        self.lower = lower
+        self.upper = upper
+
+    @classmethod
+    def build(cls, points, leaf_size=LEAF_SIZE):
+        order = np.arange(len(points))
+        start, end, left, right, lower, upper = [], [], [], [], [], []
+        stack = [(0, len(points), -1, False)]
+        while stack:
+            first, last, parent, is_right = stack.pop()
+            node = len(start)
+            if parent >= 0:
+                (right if is_right else left)[parent] = node
+            rows = order[first:last]
+            box = points[rows]
+            start.append(first)
+            end.append(last)
+            left.append(-1)
+            right.append(-1)
+            lower.append(box.min(axis=0) if len(rows) else np.zeros(points.shape[1]))
+            upper.append(box.max(axis=0) if len(rows) else np.zeros(points.shape[1]))
+            if last - first <= leaf_size:
+                continue
+            dim = int(np.argmax(upper[-1] - lower[-1]))
+            middle = (last - first) // 2
+            order[first:last] = rows[np.argpartition(box[:, dim], middle)]
+            stack.append((first + middle, last, node, True))
+            stack.append((first, first + middle, node, False))
+        return cls(order, np.array(start), np.array(end), np.array(left), np.array(right),
+                   np.array(lower).reshape(-1, points.shape[1]), np.array(upper).reshape(-1, points.shape[1]))
+
+    def arrays(self):
+        return {"tree_order": self.order, "tree_start": self.start, "tree_end": self.end, "tree_left": self.left,
+                "tree_right": self.right, "tree_lower": self.lower, "tree_upper": self.upper}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*(arrays[f"tree_{name}"] for name in ("order", "start", "end", "left", "right", "lower", "upper")))
+
+    def box_distance(self, nodes, query):
+        """
+        Squared distance from ``query`` to the bounding box of each node.
+        """
+        gap = np.maximum(self.lower[nodes] - query, 0) + np.maximum(query - self.upper[nodes], 0)
+        return np.einsum('...j,...j->...', gap, gap)
+
+
+def _features(patient):
+    if isinstance(patient, dict):
+        return np.array([float(patient[feature]) for feature in FEATURES])
+    return np.array([float(getattr(patient, feature)) for feature in FEATURES])
+
+
+class PatientIndex:
+    """
+    k-nearest-neighbour search of similar patients over z-scored body composition
+    features (FEATURES), backed by a KD-tree.
+
+    New readings go to an insert buffer that queries scan directly and removed
+    or replaced patients are tombstoned; the tree is rebuilt, and the
+    normalization refreshed, once either reaches ``rebuild_ratio`` of the tree.
+    """
+
+    def __init__(self, leaf_size=LEAF_SIZE, rebuild_ratio=REBUILD_RATIO):
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        self.size = 0
+        self.features = np.empty((0, len(FEATURES)))
+        self.points = np.empty((0, len(FEATURES)))
+        self.gender = np.empty(0, dtype=np.uint8)
+        self.activity = np.empty(0, dtype=np.uint8)
+        self.alive = np.empty(0, dtype=bool)
+        self.ids = []
+        self.rows = {}
+        self.mean = np.zeros(len(FEATURES))
+        self.scale = np.ones(len(FEATURES))
+        self.tree = KDTree.build(self.points, leaf_size)
+        self.tree_size = 0
+        self.deleted = 0
+
+    @classmethod
+    def from_patients(cls, patients, leaf_size=LEAF_SIZE, rebuild_ratio=REBUILD_RATIO):
+        index = cls(leaf_size, rebuild_ratio)
+        index.add_many(patients)
+        index.rebuild()
+        return index
+
+    def __len__(self):
+        return self.size - self.deleted
+
+    def __contains__(self, patient_id):
+        return patient_id in self.rows
+
+    def _grow(self, extra):
+        needed = self.size + extra
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 64)
+        for name in ("features", "points", "gender", "activity", "alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add_many(self, patients):
+        """
+        Add or replace ScalePatients (keyed by patient_id). Replaced readings
+        are tombstoned and the new ones go to the insert buffer.
+        """
+        patients = list(patients)
+        if not patients:
+            return
+        if any(p.patient_id is None for p in patients):
+            raise ValueError("Patients need a patient_id to be indexed.")
+        batch = PatientBatch.from_patients(patients)
+        self._grow(len(patients))
+        new = slice(self.size, self.size + len(patients))
+        self.features[new] = np.column_stack([getattr(batch, feature) for feature in FEATURES])
+        self.points[new] = (self.features[new] - self.mean) / self.scale
+        self.gender[new] = batch.gender
+        self.activity[new] = batch.activity
+        self.alive[new] = True
+        for row, patient in enumerate(patients, self.size):
+            self._tombstone(patient.patient_id)
+            self.rows[patient.patient_id] = row
+            self.ids.append(patient.patient_id)
+        self.size += len(patients)
+        self._maybe_rebuild()
+
+    def add(self, patient):
+        self.add_many([patient])
+
+    def remove(self, patient_id):
+        if patient_id not in self.rows:
+            raise KeyError(patient_id)
+        self._tombstone(patient_id)
+        self._maybe_rebuild()
+
+    def _tombstone(self, patient_id):
+        row = self.rows.pop(patient_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.deleted += 1
+
+    def _maybe_rebuild(self):
+        limit = self.rebuild_ratio * self.tree_size
+        if self.tree_size >= MIN_REBUILD:
+            limit = max(limit, MIN_REBUILD)
+        if self.size - self.tree_size > limit or self.deleted > limit:
+            self.rebuild()
+
+    def rebuild(self):
+        """
+        Drop tombstoned rows, refresh the normalization and rebuild the tree over
+        every row, emptying the insert buffer.
+        """
+        keep = np.flatnonzero(self.alive[:self.size])
+        self.features = self.features[keep]
+        self.gender = self.gender[keep]
+        self.activity = self.activity[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.ids = [self.ids[row] for row in keep]
+        self.rows = {patient_id: row for row, patient_id in enumerate(self.ids)}
+        self.size = len(keep)
+        self.deleted = 0
+        if self.size:
+            self.mean = self.features.mean(axis=0)
+            std = self.features.std(axis=0)
+            self.scale = np.where(std > 0, std, 1.0)
+        self.points = (self.features - self.mean) / self.scale
+        self.tree = KDTree.build(self.points, self.leaf_size)
+        self.tree_size = self.size
+
+    def query(self, patient, k=5, gender=None, activity=None, exclude=None):
+        """
+        The ``k`` indexed patients closest to ``patient`` (a ScalePatient or a
+        dict of FEATURES) as [(patient_id, distance)], nearest first. Distances
+        are Euclidean over z-scores. ``gender`` and ``activity`` restrict the
+        matches; ``exclude`` defaults to the patient's own patient_id.
+        """
+        query = (_features(patient) - self.mean) / self.scale
+        if exclude is None and not isinstance(patient, dict):
+            exclude = patient.patient_id
+        gender_code = None if gender is None else GENDERS.index(gender)
+        activity_code = None if activity is None else int(_encode([activity], ACTIVITY_LEVELS, ACTIVITY_ALIASES)[0])
+        excluded_row = self.rows.get(exclude, -1) if exclude is not None else -1
+
+        best_rows = np.empty(0, dtype=np.intp)
+        best_distances = np.empty(0)
+        kth = np.inf
+
+        def consider(rows):
+            nonlocal best_rows, best_distances, kth
+            mask = self.alive[rows]
+            if gender_code is not None:
+                mask &= self.gender[rows] == gender_code
+            if activity_code is not None:
+                mask &= self.activity[rows] == activity_code
+            if excluded_row >= 0:
+                mask &= rows != excluded_row
+            rows = rows[mask]
+            if not len(rows):
+                return
+            differences = self.points[rows] - query
+            distances = np.einsum('ij,ij->i', differences, differences)
+            best_rows = np.concatenate((best_rows, rows))
+            best_distances = np.concatenate((best_distances, distances))
+            if len(best_rows) > k:
+                keep = np.argpartition(best_distances, k - 1)[:k]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+            if len(best_rows) == k:
+                kth = best_distances.max()
+
+        # Insert buffer first: it tightens the bound used to prune the tree.
+        if self.size > self.tree_size:
+            consider(np.arange(self.tree_size, self.size))
+
+        tree = self.tree
+        if self.tree_size:
+            heap = [(float(tree.box_distance(0, query)), 0)]
+            while heap:
+                bound, node = heapq.heappop(heap)
+                if bound > kth:
+                    break
+                if tree.left[node] < 0:
+                    consider(tree.order[tree.start[node]:tree.end[node]])
+                    continue
+                children = [tree.left[node], tree.right[node]]
+                for child, distance in zip(children, tree.box_distance(children, query).tolist()):
+                    if distance <= kth:
+                        heapq.heappush(heap, (distance, child))
+
+        nearest = np.argsort(best_distances)
+        return [(self.ids[best_rows[i]], float(np.sqrt(best_distances[i]))) for i in nearest]
+
+    def save(self, file_path):
+        """
+        Write the index, tree included, to a NumPy .npz file.
+        """
+        size = self.size
+        np.savez(
+            file_path,
+            features=self.features[:size], points=self.points[:size], gender=self.gender[:size],
+            activity=self.activity[:size], alive=self.alive[:size], ids=np.array(self.ids, dtype=str),
+            mean=self.mean, scale=self.scale,
+            settings=np.array([self.leaf_size, self.rebuild_ratio, self.tree_size]),
+            **self.tree.arrays(),
+        )
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path, allow_pickle=False) as arrays:
+            leaf_size, rebuild_ratio, tree_size = arrays["settings"]
+            index = cls(int(leaf_size), float(rebuild_ratio))
+            for name in ("features", "points", "gender", "activity", "alive", "mean", "scale"):
+                setattr(index, name, arrays[name])
+            index.ids = arrays["ids"].tolist()
+            index.tree = KDTree.from_arrays(arrays)
+        index.size = len(index.ids)
+        index.tree_size = int(tree_size)
+        index.rows = {patient_id: row for row, patient_id in enumerate(index.ids) if index.alive[row]}
+        index.deleted = index.size - len(index.rows)
+        return index
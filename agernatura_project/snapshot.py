@@ -0,0 +1,108 @@
+import struct
+
+import numpy as np
+
+from .batch import PatientBatch, StringColumn
+from .fields import PATIENT_FIELDS, SCALE_FIELDS
+
+
+# Layout: header, column directory, then every column 64-byte aligned.
+#   header     MAGIC, version (u4), flags (u4), rows (u8), columns (u4)
+#   directory  per column: name (32s), dtype (8s), offset (u8), nbytes (u8)
+# Names and surnames are stored as two columns each: int64 offsets and a
+# UTF-8 blob.
+MAGIC = b"AGNSNAP\0"
+VERSION = 1
+HAS_SCALE_DATA = 1
+ALIGNMENT = 64
+
+_HEADER = struct.Struct("<8sIIQI")
+_ENTRY = struct.Struct("<32s8sQQ")
+
+NUMERIC_DTYPES = {
+    "age": "<i8",
+    "gender": "u1",
+    "height": "<f8",
+    "weight": "<f8",
+    "activity": "u1",
+    "waist_circunference": "<f8",
+    **{field: "<f8" for field in SCALE_FIELDS},
+}
+STRING_FIELDS = ("name", "surname")
+
+
+class SnapshotError(ValueError):
+    """
+    Invalid or unsupported snapshot file.
+    """
+
+
+def _aligned(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(file_path, cohort):
+    """
+    Write a PatientBatch (or any iterable of patients) as a binary snapshot.
+    """
+    batch = cohort if isinstance(cohort, PatientBatch) else PatientBatch.from_patients(cohort)
+    columns = []
+    for field in STRING_FIELDS:
+        strings = getattr(batch, field)
+        if not isinstance(strings, StringColumn):
+            strings = StringColumn.from_strings(strings)
+        columns.append((f"{field}.offsets", np.ascontiguousarray(strings.offsets, dtype="<i8")))
+        columns.append((f"{field}.blob", np.ascontiguousarray(strings.blob, dtype="u1")))
+    fields = [field for field in PATIENT_FIELDS if field not in STRING_FIELDS]
+    if batch.has_scale_data:
+        fields += SCALE_FIELDS
+    for field in fields:
+        columns.append((field, np.ascontiguousarray(getattr(batch, field), dtype=NUMERIC_DTYPES[field])))
+
+    position = _aligned(_HEADER.size + _ENTRY.size * len(columns))
+    entries = []
+    for name, values in columns:
+        entries.append(_ENTRY.pack(name.encode('ascii'), values.dtype.str.encode('ascii'), position, values.nbytes))
+        position = _aligned(position + values.nbytes)
+
+    flags = HAS_SCALE_DATA if batch.has_scale_data else 0
+    with open(file_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, flags, len(batch), len(columns)))
+        file.write(b"".join(entries))
+        for (name, values), entry in zip(columns, entries):
+            file.seek(_ENTRY.unpack(entry)[2])
+            values.tofile(file)
+        file.truncate(position)
+
+
+def load_snapshot(file_path):
+    """
+    Memory-map a snapshot and return a PatientBatch whose columns are views of
+    the mapped file, so opening it costs no parsing or copying.
+    """
+    mapped = np.memmap(file_path, dtype=np.uint8, mode='r')
+    if len(mapped) < _HEADER.size:
+        raise SnapshotError(f"{file_path} is too small to be a snapshot")
+    magic, version, flags, rows, column_count = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise SnapshotError(f"{file_path} is not a patient snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"{file_path} uses snapshot version {version}, expected {VERSION}")
+
+    columns = {}
+    for i in range(column_count):
+        name, dtype, offset, nbytes = _ENTRY.unpack_from(mapped, _HEADER.size + i * _ENTRY.size)
+        name = name.rstrip(b"\0").decode('ascii')
+        columns[name] = mapped[offset:offset + nbytes].view(np.dtype(dtype.rstrip(b"\0").decode('ascii')))
+
+    values = {
+        field: StringColumn(columns[f"{field}.offsets"], columns[f"{field}.blob"]) for field in STRING_FIELDS
+    }
+    fields = [field for field in PATIENT_FIELDS if field not in STRING_FIELDS]
+    if flags & HAS_SCALE_DATA:
+        fields += SCALE_FIELDS
+    for field in fields:
+        if len(columns[field]) != rows:
+            raise SnapshotError(f"column {field} has {len(columns[field])} rows, expected {rows}")
+        values[field] = columns[field]
+    return PatientBatch(**values)
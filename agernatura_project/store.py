@@ -0,0 +1,231 @@
+import json
+import sqlite3
+from itertools import islice
+
+from .classification import get_engine
+from .fields import PATIENT_FIELDS, PATIENT_METRICS, SCALE_FIELDS, SCALE_METRICS
+from .patient import Patient, ScalePatient
+
+
+CATEGORY_COLUMNS = tuple(f"{metric}_code" for metric in PATIENT_METRICS + SCALE_METRICS)
+
+COLUMNS = ("patient_id",) + PATIENT_FIELDS + SCALE_FIELDS + CATEGORY_COLUMNS
+
+# Every patient row records, in tables_id, the reference tables its category
+# codes were computed with (see PatientStore.reclassify).
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reference_tables (
+    id INTEGER PRIMARY KEY,
+    definitions TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT,
+    name TEXT NOT NULL,
+    surname TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    height REAL NOT NULL,
+    weight REAL NOT NULL,
+    activity TEXT NOT NULL,
+    waist_circunference REAL NOT NULL,
+    {", ".join(f"{column} REAL" for column in SCALE_FIELDS)},
+    {", ".join(f"{column} INTEGER" for column in CATEGORY_COLUMNS)},
+    tables_id INTEGER
+);
+"""
+INDEXES = f"""
+CREATE INDEX IF NOT EXISTS patients_tables_id ON patients (tables_id);
+CREATE INDEX IF NOT EXISTS patients_patient_id ON patients (patient_id);
+CREATE INDEX IF NOT EXISTS patients_gender_age ON patients (gender, age);
+{"".join(f"CREATE INDEX IF NOT EXISTS patients_{column} ON patients ({column}, gender, age);" for column in CATEGORY_COLUMNS)}
+"""
+
+
+def _codes(engine, patient):
+    is_scale = isinstance(patient, ScalePatient)
+    codes = [engine.classify_code(metric, patient) for metric in PATIENT_METRICS]
+    return codes + [engine.classify_code(metric, patient) if is_scale else None for metric in SCALE_METRICS]
+
+
+def _row(engine, tables_id, patient):
+    values = [patient.patient_id] + [getattr(patient, field) for field in PATIENT_FIELDS]
+    is_scale = isinstance(patient, ScalePatient)
+    values += [getattr(patient, field) if is_scale else None for field in SCALE_FIELDS]
+    return values + _codes(engine, patient) + [tables_id]
+
+
+def _patient(row):
+    patient_values = row[1:1 + len(PATIENT_FIELDS)]
+    scale_values = row[1 + len(PATIENT_FIELDS):1 + len(PATIENT_FIELDS) + len(SCALE_FIELDS)]
+    if scale_values[0] is None:
+        patient = Patient(*patient_values)
+    else:
+        patient = ScalePatient(*patient_values, *scale_values)
+    patient.patient_id = row[0]
+    return patient
+
+
+def _category_code(metric, category):
+    if isinstance(category, int):
+        return category
+    labels = get_engine().labels(metric)
+    if category not in labels:
+        raise ValueError(f"{category} invalid, must be in {list(labels)}")
+    return labels.index(category)
+
+
+class PatientStore:
+    """
+    SQLite storage for Patient/ScalePatient. Every row keeps the category codes
+    of each classifier, indexed together with gender and age, so cohort queries
+    never reclassify. Codes are computed when a row is inserted; after
+    load_reference_tables, queries by label are refused until reclassify()
+    has brought the rows of the changed tables up to date.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(patients)")]
+        if "tables_id" not in columns:
+            # Stores written before tables_id existed: their rows count as
+            # classified with unknown tables.
+            self.connection.execute("ALTER TABLE patients ADD COLUMN tables_id INTEGER")
+        self.connection.executescript(INDEXES)
+        self._tables = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def bulk_insert(self, patients, batch_size=5000):
+        """
+        Insert patients in transactions of ``batch_size`` rows; a failing batch is
+        rolled back as a whole. Returns the number of rows inserted.
+        """
+        columns = COLUMNS + ("tables_id",)
+        statement = f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        engine = get_engine()
+        tables_id = self._tables_id(engine)
+        patients = iter(patients)
+        inserted = 0
+        while True:
+            rows = [_row(engine, tables_id, patient) for patient in islice(patients, batch_size)]
+            if not rows:
+                return inserted
+            with self.connection:
+                self.connection.executemany(statement, rows)
+            inserted += len(rows)
+
+    def _tables_id(self, engine):
+        """
+        Id of the reference tables of ``engine`` in reference_tables, which
+        stores the definition of each of their metrics.
+        """
+        if self._tables is not None and self._tables[0] is engine:
+            return self._tables[1]
+        definitions = json.dumps({metric: table.definition for metric, table in engine.tables.items()}, sort_keys=True)
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO reference_tables (definitions) VALUES (?)", (definitions,))
+        tables_id = self.connection.execute(
+            "SELECT id FROM reference_tables WHERE definitions = ?", (definitions,)
+        ).fetchone()[0]
+        self._tables = (engine, tables_id)
+        return tables_id
+
+    def _check_labels(self, metric):
+        """
+        Raise ValueError if any row was classified with another table for
+        ``metric`` than the active one: its stored code may not mean the label
+        the active table gives it.
+        """
+        definition = get_engine().table(metric).definition
+        stale = [tables_id for tables_id, definitions in self.connection.execute("SELECT id, definitions FROM reference_tables")
+                 if json.loads(definitions).get(metric) != definition]
+        found = self.connection.execute(
+            f"SELECT EXISTS (SELECT 1 FROM patients WHERE tables_id IS NULL OR tables_id IN ({', '.join('?' * len(stale))}))",
+            stale,
+        ).fetchone()[0]
+        if found:
+            raise ValueError(f"Some rows were classified with another {metric} table: query them by code or "
+                             f"call reclassify() first.")
+
+    def reclassify(self, batch_size=5000):
+        """
+        Recompute the category codes of every row classified with other
+        reference tables than the active ones, in transactions of
+        ``batch_size`` rows. Returns the number of rows updated.
+        """
+        engine = get_engine()
+        tables_id = self._tables_id(engine)
+        select = f"SELECT id, {', '.join(COLUMNS)} FROM patients WHERE tables_id IS NULL OR tables_id != ? LIMIT ?"
+        update = f"UPDATE patients SET {', '.join(f'{column} = ?' for column in CATEGORY_COLUMNS)}, tables_id = ? WHERE id = ?"
+        updated = 0
+        while True:
+            rows = self.connection.execute(select, (tables_id, batch_size)).fetchall()
+            if not rows:
+                return updated
+            with self.connection:
+                self.connection.executemany(
+                    update, [_codes(engine, _patient(row[1:])) + [tables_id, row[0]] for row in rows]
+                )
+            updated += len(rows)
+
+    def _where(self, gender=None, min_age=None, max_age=None, **categories):
+        clauses = []
+        params = []
+        if gender is not None:
+            clauses.append("gender = ?")
+            params.append(gender.lower())
+        if min_age is not None:
+            clauses.append("age >= ?")
+            params.append(min_age)
+        if max_age is not None:
+            clauses.append("age <= ?")
+            params.append(max_age)
+        for metric, wanted in categories.items():
+            if metric not in PATIENT_METRICS + SCALE_METRICS:
+                raise ValueError(f"{metric} invalid, must be in {list(PATIENT_METRICS + SCALE_METRICS)}")
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            if not all(isinstance(category, int) for category in wanted):
+                self._check_labels(metric)
+            codes = [_category_code(metric, category) for category in wanted]
+            clauses.append(f"{metric}_code IN ({', '.join('?' * len(codes))})")
+            params.extend(codes)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, gender=None, min_age=None, max_age=None, fetch_size=1000, **categories):
+        """
+        Yield patients matching every filter, built one row at a time as the
+        cursor is consumed. Categories are filtered by metric name with a label,
+        a code or a list of them, e.g. ``query("m", min_age=50, ev_gv="Alarmante")``.
+        """
+        where, params = self._where(gender, min_age, max_age, **categories)
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM patients{where} ORDER BY id", params
+        )
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield _patient(row)
+
+    def count(self, gender=None, min_age=None, max_age=None, **categories):
+        where, params = self._where(gender, min_age, max_age, **categories)
+        return self.connection.execute(f"SELECT COUNT(*) FROM patients{where}", params).fetchone()[0]
+
+    def get(self, patient_id):
+        row = self.connection.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM patients WHERE patient_id = ? ORDER BY id DESC LIMIT 1",
+            (patient_id,),
+        ).fetchone()
+        return None if row is None else _patient(row)
@@ -0,0 +1,263 @@
+import csv
+
+import numpy as np
+
+from .batch import PatientBatch
+from .fields import ACTIVITY_ALIASES, ACTIVITY_LEVELS, GENDERS, PATIENT_FIELDS, SCALE_FIELDS
+from .patient import ActivityError, GenderError
+
+
+ACTIVITY_CHOICES = ACTIVITY_LEVELS + tuple(ACTIVITY_ALIASES)
+CSV_COLUMNS = {
+    "name": "Name",
+    "surname": "Surname",
+    "age": "Age",
+    "gender": "Gender",
+    "height": "Height",
+    "weight": "Weight",
+    "activity": "Activity",
+    "waist_circunference": "WaistCircumference",
+    "mgras_percent": "MgrasPercent",
+    "bone_mass": "BoneMass",
+    "muscular_mass_kg": "MuscularMassKg",
+    "imc": "IMC",
+    "metabolic_age": "MetabolicAge",
+    "visceral_gras": "VisceralGras",
+    "water_levels": "WaterLevels",
+}
+
+STRING_FIELDS = ("name", "surname")
+INTEGER_FIELDS = ("age",)
+# The same non-negative checks Patient and ScalePatient run (water_levels has none).
+PATIENT_RANGE_FIELDS = ("height", "weight")
+SCALE_RANGE_FIELDS = ("waist_circunference", "mgras_percent", "bone_mass", "muscular_mass_kg", "imc",
+                      "metabolic_age", "visceral_gras")
+PARSE_BLOCK = 4096
+
+
+def _checks(scale):
+    """
+    (field, kind) of every check, in the order their bits are numbered.
+    """
+    fields = PATIENT_FIELDS + SCALE_FIELDS if scale else PATIENT_FIELDS
+    checks = [(field, "type") for field in fields if field not in ("gender", "activity")]
+    ranges = PATIENT_RANGE_FIELDS + SCALE_RANGE_FIELDS if scale else PATIENT_RANGE_FIELDS
+    checks += [(field, "range") for field in ranges]
+    checks += [("gender", "choice"), ("activity", "choice")]
+    return checks
+
+
+def _error(field, kind, value):
+    """
+    The exception the Patient/ScalePatient constructors raise for this check.
+    """
+    if kind == "type":
+        if field in STRING_FIELDS:
+            return TypeError(f"{value} must be a string.")
+        if field in INTEGER_FIELDS:
+            return TypeError(f"{value} must be an integer.")
+        return TypeError(f"{value} must be a float or integer")
+    if kind == "range":
+        return ValueError(f"{value} must be a positive value")
+    if field == "gender":
+        return GenderError(f"{value} is invalid, must be 'H' for men or 'W' for women.")
+    return ActivityError(f"{value} invalid, must be in ['Sedentario', 'Poco activo', 'Activo con moderacion', 'Activo', 'Muy activo']")
+
+
+def _numeric_column(values, integer, parse):
+    """
+    (values as an int64/float64 array, mask of the rows that are numbers). With
+    ``parse`` strings are converted like int()/float() do for CSV rows,
+    otherwise only int and float instances (int for integers, bool included)
+    pass, as in the Patient constructor, so NumPy floats are numbers too.
+    """
+    dtype = np.int64 if integer else np.float64
+    if isinstance(values, np.ndarray) and values.dtype.kind in ("iub" if integer else "iubf"):
+        return values.astype(dtype, copy=False), np.ones(len(values), dtype=bool)
+
+    if parse:
+        convert = int if integer else float
+        parsed = np.zeros(len(values), dtype=dtype)
+        ok = np.ones(len(values), dtype=bool)
+        # Convert in blocks and only fall back to one value at a time inside the
+        # blocks that hold a bad value.
+        for start in range(0, len(values), PARSE_BLOCK):
+            block = values[start:start + PARSE_BLOCK]
+            try:
+                parsed[start:start + len(block)] = np.fromiter(map(convert, block), dtype=dtype, count=len(block))
+                continue
+            except (ValueError, TypeError, OverflowError):
+                pass
+            for row, value in enumerate(block, start):
+                try:
+                    parsed[row] = convert(value)
+                except (ValueError, TypeError, OverflowError):
+                    ok[row] = False
+        return parsed, ok
+
+    allowed = int if integer else (int, float)
+    ok = np.fromiter((isinstance(value, allowed) for value in values), dtype=bool, count=len(values))
+    if ok.all():
+        return np.asarray(values, dtype=dtype), ok
+    parsed = np.zeros(len(values), dtype=dtype)
+    parsed[ok] = np.asarray([value for value, good in zip(values, ok) if good], dtype=dtype)
+    return parsed, ok
+
+
+def _choice_mask(values, choices):
+    choices = set(choices)
+    return np.fromiter((isinstance(value, str) and value in choices for value in values), dtype=bool, count=len(values))
+
+
+class ValidationResult:
+    """
+    Outcome of validating a table of rows at once. ``flags`` holds one bit per
+    failed check and row (bit order in ``checks``), ``valid`` is the mask of the
+    rows with no failure. Error messages are only built when asked for.
+    """
+
+    def __init__(self, columns, parsed, checks, flags, scale, line_numbers=None):
+        self.columns = columns
+        self.parsed = parsed
+        self.checks = checks
+        self.flags = flags
+        self.scale = scale
+        self.line_numbers = line_numbers
+        self.valid = flags == 0
+
+    def __len__(self):
+        return len(self.flags)
+
+    @property
+    def valid_count(self):
+        return int(self.valid.sum())
+
+    @property
+    def invalid_rows(self):
+        return np.flatnonzero(~self.valid)
+
+    def exceptions(self, row):
+        """
+        The exception of every check row ``row`` fails.
+        """
+        flags = int(self.flags[row])
+        return [_error(field, kind, self.columns[field][row])
+                for bit, (field, kind) in enumerate(self.checks) if flags >> bit & 1]
+
+    def errors(self, row):
+        """
+        Messages of every check row ``row`` fails, formatted like RejectedRow.reason.
+        """
+        return [f"{type(error).__name__}: {error}" for error in self.exceptions(row)]
+
+    def report(self):
+        """
+        {row index: [messages]} for every invalid row.
+        """
+        return {int(row): self.errors(row) for row in self.invalid_rows}
+
+    def valid_columns(self):
+        """
+        Parsed columns (numpy arrays for numbers, lists for strings) of the valid rows.
+        """
+        rows = np.flatnonzero(self.valid)
+        return {
+            field: values[rows] if isinstance(values, np.ndarray) else [values[row] for row in rows]
+            for field, values in self.parsed.items()
+        }
+
+    def to_batch(self):
+        return PatientBatch(**self.valid_columns())
+
+
+def validate_columns(columns, scale=None, parse=False, line_numbers=None):
+    """
+    Validate column arrays keyed by the Patient/ScalePatient argument names with
+    the same rules as the constructors, for all rows at once and reporting every
+    failed check of every row. ``scale`` defaults to whether the scale columns
+    are present; ``parse`` converts numeric strings as the CSV readers do.
+    """
+    if scale is None:
+        scale = all(field in columns for field in SCALE_FIELDS)
+    fields = PATIENT_FIELDS + SCALE_FIELDS if scale else PATIENT_FIELDS
+    missing = [field for field in fields if field not in columns]
+    if missing:
+        raise KeyError(f"Missing columns: {missing}")
+    return _validate(columns, fields, _checks(scale), parse, scale, line_numbers)
+
+
+def validate_scale_columns(columns, parse=False, line_numbers=None):
+    """
+    Validate only the readings ScalePatient adds to a Patient (waist
+    circumference and SCALE_FIELDS), for joining scale exports to patients
+    that are already validated.
+    """
+    fields = ("waist_circunference",) + SCALE_FIELDS
+    missing = [field for field in fields if field not in columns]
+    if missing:
+        raise KeyError(f"Missing columns: {missing}")
+    checks = [(field, "type") for field in fields] + [(field, "range") for field in SCALE_RANGE_FIELDS]
+    return _validate(columns, fields, checks, parse, True, line_numbers)
+
+
+def _validate(columns, fields, checks, parse, scale, line_numbers):
+    size = len(columns[fields[0]])
+    if any(len(columns[field]) != size for field in fields):
+        raise ValueError("All columns must have the same length.")
+    flags = np.zeros(size, dtype=np.uint32)
+    parsed = {}
+
+    def fail(check, mask):
+        flags[mask] |= np.uint32(1 << checks.index(check))
+
+    for field in fields:
+        values = columns[field]
+        if field in ("gender", "activity"):
+            choices = GENDERS if field == "gender" else ACTIVITY_CHOICES
+            fail((field, "choice"), ~_choice_mask(values, choices))
+            parsed[field] = list(values)
+        elif field in STRING_FIELDS:
+            ok = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=size)
+            fail((field, "type"), ~ok)
+            parsed[field] = list(values)
+        else:
+            parsed[field], ok = _numeric_column(values, field in INTEGER_FIELDS, parse)
+            fail((field, "type"), ~ok)
+            if (field, "range") in checks:
+                fail((field, "range"), ok & (parsed[field] < 0))
+    return ValidationResult(columns, parsed, checks, flags, scale, line_numbers)
+
+
+def csv_columns(header, rows, names):
+    """
+    {name: column} of the CSV columns ``names`` of already read rows. Short rows
+    give None for their missing values.
+    """
+    indexes = [header.index(name) for name in names]
+    if all(len(row) == len(header) for row in rows):
+        transposed = list(zip(*rows)) if rows else [()] * len(header)
+        return {name: transposed[index] for name, index in zip(names, indexes)}
+    return {name: [row[index] if index < len(row) else None for row in rows] for name, index in zip(names, indexes)}
+
+
+def validate_csv(file_path, scale=None):
+    """
+    Read a patient CSV file into columns and validate every row at once. Rows are
+    numbered from 0 in the result; ``line_numbers`` has their line in the file.
+    """
+    with open(file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = []
+        line_numbers = []
+        # Blank lines are skipped, as DictReader does for the constructors.
+        for row in filter(None, reader):
+            rows.append(row)
+            line_numbers.append(reader.line_num)
+
+    if scale is None:
+        scale = all(CSV_COLUMNS[field] in header for field in SCALE_FIELDS)
+    fields = PATIENT_FIELDS + SCALE_FIELDS if scale else PATIENT_FIELDS
+    by_name = csv_columns(header, rows, [CSV_COLUMNS[field] for field in fields])
+    columns = {field: by_name[CSV_COLUMNS[field]] for field in fields}
+    return validate_columns(columns, scale, parse=True, line_numbers=np.asarray(line_numbers))
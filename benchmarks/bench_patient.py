@@ -0,0 +1,236 @@
+"""
+Benchmark suite for the hot paths of agernatura_project.patient.
+
+Generates synthetic cohorts, then measures CSV ingestion, Patient/ScalePatient
+validation, every get_* classifier, run_health_checks and every chart method.
+Each benchmark reports throughput, latency percentiles and peak traced memory,
+and the whole run can be saved as JSON and compared against a previous one.
+
+    python benchmarks/bench_patient.py --sizes 1000 100000 --output run.json
+    python benchmarks/bench_patient.py --sizes 1000000 --skip charts
+    python benchmarks/bench_patient.py --compare baseline.json run.json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agernatura_project.patient import Patient, ScalePatient, run_health_checks  # noqa: E402
+
+DEFAULT_SIZES = (1_000, 100_000)
+CHART_SAMPLE = 20
+CLASSIFIERS = ("get_basal_metabolic_rate", "get_cardiovascular_risk", "get_complexion", "get_imc_standard",
+               "get_mgras_percent", "get_w_level", "get_im_muscular", "get_ev_gv")
+CHARTS = ("get_imc_graf", "get_gc_graf", "get_wl_graf", "get_cvrisk_graf")
+ACTIVITIES = ("sedentario", "poco activo", "activo con moderacion", "activo", "muy activo")
+CSV_COLUMNS = ("Name", "Surname", "Age", "Gender", "Height", "Weight", "Activity", "WaistCircumference",
+               "MgrasPercent", "BoneMass", "MuscularMassKg", "IMC", "MetabolicAge", "VisceralGras", "WaterLevels")
+
+
+def synthetic_args(size, seed=0):
+    """
+    ScalePatient constructor arguments for ``size`` plausible patients.
+    """
+    rng = random.Random(seed)
+    for i in range(size):
+        gender = rng.choice("hm")
+        height = round(rng.uniform(150, 195), 1)
+        weight = round(rng.uniform(45, 120), 1)
+        yield (f"Nombre{i}", f"Apellido{i}", rng.randint(16, 85), gender, height, weight,
+               rng.choice(ACTIVITIES), float(rng.randint(60, 130)), round(rng.uniform(5, 50), 1),
+               round(rng.uniform(1.5, 4), 1), round(rng.uniform(20, 65), 1),
+               round(weight / (height / 100) ** 2, 1), float(rng.randint(18, 80)),
+               float(rng.randint(1, 20)), round(rng.uniform(35, 75), 1))
+
+
+def write_csv(file_path, size, seed=0):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(synthetic_args(size, seed))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(name, size, units, seconds, latencies_ns, peak_bytes):
+    latencies_ns.sort()
+    return {
+        "name": name,
+        "size": size,
+        "units": units,
+        "seconds": seconds,
+        "throughput_per_s": units / seconds if seconds else None,
+        "latency_us": {
+            label: percentile(latencies_ns, fraction) / 1000
+            for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        },
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+def run_per_item(name, size, items, op, reset=None):
+    """
+    Time ``op(item)`` for every item, then run it again under tracemalloc,
+    keeping the results, for the peak memory so tracing does not distort the
+    timings.
+    """
+    latencies = []
+    clock = time.perf_counter_ns
+    for item in items:
+        if reset:
+            reset(item)
+    start = clock()
+    for item in items:
+        before = clock()
+        op(item)
+        latencies.append(clock() - before)
+    seconds = (clock() - start) / 1e9
+
+    for item in items:
+        if reset:
+            reset(item)
+    tracemalloc.start()
+    kept = [op(item) for item in items]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return summarize(name, size, len(items), seconds, latencies, peak)
+
+
+def bench_csv(size, csv_path):
+    latencies = []
+    clock = time.perf_counter_ns
+    start = clock()
+    rows = ScalePatient.iter_patients_from_csv(csv_path)
+    while True:
+        before = clock()
+        if next(rows, None) is None:
+            break
+        latencies.append(clock() - before)
+    seconds = (clock() - start) / 1e9
+
+    tracemalloc.start()
+    patients = ScalePatient.create_patients_from_csv(csv_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize("create_patients_from_csv", size, len(patients), seconds, latencies, peak), patients
+
+
+def _clear_cache(patient):
+    # Measure the computation itself, not a memoized hit.
+    patient._cache = None
+
+
+def bench_size(size, skip):
+    results = []
+    args = list(synthetic_args(size))
+    base_args = [a[:8] for a in args]
+
+    if "ingestion" not in skip:
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "patients.csv")
+            write_csv(csv_path, size)
+            result, _ = bench_csv(size, csv_path)
+            results.append(result)
+
+    if "validation" not in skip:
+        results.append(run_per_item("Patient.__init__", size, base_args, lambda a: Patient(*a)))
+        results.append(run_per_item("ScalePatient.__init__", size, args, lambda a: ScalePatient(*a)))
+
+    patients = [ScalePatient(*a) for a in args]
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        if "classifiers" not in skip:
+            for method in CLASSIFIERS:
+                results.append(run_per_item(f"ScalePatient.{method}", size, patients,
+                                            lambda p, m=method: getattr(p, m)(), _clear_cache))
+                sink.seek(0)
+                sink.truncate()
+        if "health_checks" not in skip:
+            results.append(run_per_item("run_health_checks", size, patients, run_health_checks, _clear_cache))
+
+    if "charts" not in skip:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        sample = patients[:CHART_SAMPLE]
+
+        def draw(patient, method):
+            getattr(patient, method)()
+            plt.gcf().canvas.draw()
+            plt.close("all")
+
+        for method in CHARTS:
+            results.append(run_per_item(f"ScalePatient.{method}", size, sample, lambda p, m=method: draw(p, m)))
+    return results
+
+
+def compare(baseline_path, current_path):
+    with open(baseline_path) as file:
+        baseline = {(r["name"], r["size"]): r for r in json.load(file)["results"]}
+    with open(current_path) as file:
+        current = json.load(file)["results"]
+
+    print(f"{'benchmark':<42}{'size':>9}{'baseline/s':>14}{'current/s':>14}{'change':>9}")
+    for result in current:
+        before = baseline.get((result["name"], result["size"]))
+        if before is None or not before["throughput_per_s"]:
+            continue
+        change = result["throughput_per_s"] / before["throughput_per_s"] - 1
+        print(f"{result['name']:<42}{result['size']:>9}{before['throughput_per_s']:>14.0f}"
+              f"{result['throughput_per_s']:>14.0f}{change:>+9.1%}")
+
+
+def print_table(results):
+    print(f"{'benchmark':<42}{'size':>9}{'ops/s':>12}{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}{'peak MiB':>10}")
+    for r in results:
+        latency = r["latency_us"]
+        print(f"{r['name']:<42}{r['size']:>9}{r['throughput_per_s']:>12.0f}{latency['p50']:>9.1f}"
+              f"{latency['p95']:>9.1f}{latency['p99']:>9.1f}{r['peak_memory_bytes'] / 2 ** 20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--skip", nargs="*", default=[],
+                        choices=["ingestion", "validation", "classifiers", "health_checks", "charts"])
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two saved JSON runs instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for size in args.sizes:
+        results.extend(bench_size(size, set(args.skip)))
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
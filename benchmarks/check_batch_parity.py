@@ -0,0 +1,134 @@
+"""
+Scalar-vs-batch parity check for the classification engine.
+
+Builds ScalePatients on and around every cutoff and band edge of the reference
+tables and fails if PatientBatch gives a different BMR or category code than the
+scalar methods, if the batch labels do not follow load_reference_tables, or if
+the corrected age-band behaviour of get_mgras_percent/get_im_muscular changes.
+
+    python benchmarks/check_batch_parity.py
+"""
+import copy
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agernatura_project import batch  # noqa: E402
+from agernatura_project.batch import GENDERS, PatientBatch  # noqa: E402
+from agernatura_project.classification import (  # noqa: E402
+    REFERENCE_TABLES, get_engine, load_reference_tables)
+from agernatura_project.patient import ScalePatient  # noqa: E402
+
+METRICS = ("cardiovascular_risk", "complexion", "imc_standard", "mgras_percent", "w_level", "im_muscular", "ev_gv")
+DEFAULTS = {
+    "name": "Ana", "surname": "Paridad", "age": 40, "gender": "m", "height": 165.0, "weight": 60.0,
+    "activity": "activo", "waist_circunference": 85.0, "mgras_percent": 28.0, "bone_mass": 2.5,
+    "muscular_mass_kg": 40.0, "imc": 24.0, "metabolic_age": 40.0, "visceral_gras": 7.0, "water_levels": 55.0,
+}
+FIELDS = tuple(DEFAULTS)
+# The later age blocks of the original if/elif chains overwrote the earlier
+# ones; the reference tables apply the band of the patient's age instead.
+# (gender, age, metric, value, expected label, label of the old fall-through)
+CORRECTED_CASES = (
+    ("m", 20, "mgras_percent", 17.0, "Ideal", "Delgado"),
+    ("h", 18, "mgras_percent", 10.0, "Ideal", "Delgado"),
+    ("h", 33, "mgras_percent", 9.0, "Delgado", "Delgado"),
+    ("m", 25, "im_muscular", 34.0, "Baja", "Normal"),
+    ("m", 25, "im_muscular", 40.0, "Normal", "Excesiva"),
+    ("h", 30, "im_muscular", 42.0, "Baja", "Normal"),
+)
+
+
+def _around(edges):
+    values = set()
+    for edge in edges:
+        if math.isfinite(edge):
+            values.update((edge, math.nextafter(edge, -math.inf), edge - 0.5, edge + 0.5))
+    return sorted(value for value in values if value >= 0)
+
+
+def boundary_patients():
+    patients = []
+    engine = get_engine()
+    for metric in METRICS:
+        table = engine.table(metric)
+        for gender in GENDERS:
+            group = table.group(gender)
+            band_values = [None]
+            if table.band_by:
+                band_values = _around(group.band_edges) or [DEFAULTS[table.band_by]]
+            if table.band_by == "age":
+                band_values = sorted({int(value) for value in band_values})
+            for band_value in band_values:
+                cutoffs = [edge for edges in group.cutoff_edges for edge in edges]
+                for value in _around(cutoffs):
+                    values = dict(DEFAULTS, gender=gender)
+                    values[table.value] = value
+                    if table.band_by:
+                        values[table.band_by] = band_value
+                    patients.append(ScalePatient(*(values[field] for field in FIELDS)))
+    return patients
+
+
+def check_parity(patients):
+    failures = []
+    results = PatientBatch.from_patients(patients).classify_all()
+    bmr = np.array([patient.basal_metabolic_rate() for patient in patients])
+    if not np.allclose(results["basal_metabolic_rate"], bmr, rtol=0, atol=1e-9):
+        failures.append("basal_metabolic_rate differs")
+    for metric in METRICS:
+        scalar = np.array([patient.category_code(metric) for patient in patients])
+        rows = np.flatnonzero(scalar != results[metric])
+        for row in rows[:3]:
+            patient = patients[row]
+            failures.append(f"{metric}: {[getattr(patient, field) for field in FIELDS[2:]]} "
+                            f"scalar {scalar[row]} batch {results[metric][row]}")
+    return failures
+
+
+def check_corrected_bands():
+    failures = []
+    for gender, age, metric, value, expected, _ in CORRECTED_CASES:
+        values = dict(DEFAULTS, gender=gender, age=age)
+        values[get_engine().table(metric).value] = value
+        patient = ScalePatient(*(values[field] for field in FIELDS))
+        codes = PatientBatch.from_patients([patient]).classify(metric)
+        for source, label in (("scalar", patient.category(metric)), ("batch", batch.labels(codes, metric)[0])):
+            if label != expected:
+                failures.append(f"{metric} {gender} age {age} value {value}: {source} gave {label}, expected {expected}")
+    return failures
+
+
+def check_reloaded_labels():
+    tables = copy.deepcopy(REFERENCE_TABLES)
+    tables["ev_gv"]["labels"].append("Crítico")
+    tables["ev_gv"]["groups"]["*"][0]["cutoffs"].append(17)
+    load_reference_tables(tables)
+    try:
+        patient = ScalePatient(*(dict(DEFAULTS, visceral_gras=20.0)[field] for field in FIELDS))
+        codes = PatientBatch.from_patients([patient]).classify("ev_gv")
+        failures = []
+        if batch.EV_GV_LABELS != get_engine().labels("ev_gv"):
+            failures.append("batch.EV_GV_LABELS does not follow load_reference_tables")
+        scalar = patient.category("ev_gv")
+        if scalar != "Crítico" or batch.labels(codes, "ev_gv")[0] != scalar:
+            failures.append("batch and scalar labels differ after load_reference_tables")
+        return failures + check_parity(boundary_patients())
+    finally:
+        load_reference_tables(REFERENCE_TABLES)
+
+
+def main():
+    patients = boundary_patients()
+    failures = check_parity(patients) + check_corrected_bands() + check_reloaded_labels()
+    print(f"{len(patients)} boundary patients, {len(METRICS)} metrics, {len(CORRECTED_CASES)} corrected cases")
+    if failures:
+        raise SystemExit("FAIL:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Serial-vs-parallel parity check for CSV ingestion.
+
+Writes patient and scale-patient CSV files with valid rows, invalid rows, short
+and long rows and blank lines (inside the file, between byte ranges and at the
+end) and fails if ingest_csv_parallel accepts or rejects different lines, or
+builds different patients, than Patient.iter_patients_from_csv.
+
+    python benchmarks/check_csv_parity.py
+"""
+import csv
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agernatura_project.batch import PATIENT_FIELDS, SCALE_FIELDS  # noqa: E402
+from agernatura_project.parallel import ingest_csv_parallel  # noqa: E402
+from agernatura_project.patient import ACTIVITY_FACTORS, Patient, ScalePatient  # noqa: E402
+from agernatura_project.validation import CSV_COLUMNS  # noqa: E402
+
+ROWS = 400
+WORKERS = 2
+ACTIVITIES = ("sedentario", "poco activo", "activo con moderacion", "activo con moderación", "activo", "muy activo")
+
+
+def _row(i, scale):
+    row = [f"Nombre{i}", f"Apellido{i % 7}", str(18 + i % 60), "hm"[i % 2], str(150 + i % 40), str(50 + i % 45),
+           ACTIVITIES[i % len(ACTIVITIES)], str(70 + i % 30)]
+    if scale:
+        row += [str(10 + i % 30), "2.5", str(30 + i % 20), str(18 + i % 15), str(20 + i % 50), str(1 + i % 20),
+                str(45 + i % 20)]
+    return row
+
+
+def _broken(i, row):
+    kind = i % 5
+    if kind == 0:
+        return row[:3]
+    if kind == 1:
+        return row[:2] + ["veinte"] + row[3:]
+    if kind == 2:
+        return row[:3] + ["x"] + row[4:]
+    if kind == 3:
+        return [""] * len(row)
+    return row + ["extra"]
+
+
+def write_csv(path, scale, line_ending):
+    fields = PATIENT_FIELDS + SCALE_FIELDS if scale else PATIENT_FIELDS
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file, lineterminator=line_ending)
+        writer.writerow([CSV_COLUMNS[field] for field in fields])
+        for i in range(ROWS):
+            row = _row(i, scale)
+            writer.writerow(_broken(i, row) if i % 17 == 0 else row)
+            if i % 23 == 0:
+                file.write(line_ending)
+        file.write(line_ending)
+
+
+def _values(patient, fields):
+    # The parallel path stores the canonical spelling of the activity alias.
+    return [ACTIVITY_FACTORS[value] if field == "activity" else value
+            for field, value in ((field, getattr(patient, field)) for field in fields)]
+
+
+def check_file(path, cls):
+    fields = ("patient_id",) + (PATIENT_FIELDS + SCALE_FIELDS if cls is ScalePatient else PATIENT_FIELDS)
+    serial_errors = []
+    serial = list(cls.iter_patients_from_csv(path, errors=serial_errors))
+    parallel_errors = []
+    parallel, _ = ingest_csv_parallel(path, cls, workers=WORKERS, errors=parallel_errors)
+
+    failures = []
+    serial_lines = [error.line_number for error in serial_errors]
+    parallel_lines = [error.line_number for error in parallel_errors]
+    if serial_lines != parallel_lines:
+        failures.append(f"{cls.__name__}: rejected lines differ: serial {serial_lines} parallel {parallel_lines}")
+    if len(serial) != len(parallel):
+        failures.append(f"{cls.__name__}: {len(serial)} serial patients, {len(parallel)} parallel")
+    for serial_patient, parallel_patient in zip(serial, parallel):
+        if _values(serial_patient, fields) != _values(parallel_patient, fields):
+            failures.append(f"{cls.__name__}: patient {serial_patient.patient_id} differs")
+            break
+    return failures, len(serial), len(serial_errors)
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        for cls in (Patient, ScalePatient):
+            for line_ending in ("\n", "\r\n"):
+                path = os.path.join(directory, f"{cls.__name__}.csv")
+                write_csv(path, cls is ScalePatient, line_ending)
+                file_failures, accepted, rejected = check_file(path, cls)
+                failures += file_failures
+                print(f"{cls.__name__} {line_ending!r}: {accepted} accepted, {rejected} rejected")
+    if failures:
+        raise SystemExit("FAIL:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
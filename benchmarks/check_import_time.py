@@ -0,0 +1,54 @@
+"""
+Import-time regression check for the non-plotting API.
+
+Imports agernatura_project.patient in fresh interpreters and fails if the best
+cold import exceeds the budget or if matplotlib gets imported along the way.
+
+    python benchmarks/check_import_time.py [--budget-ms 100] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "agernatura_project.patient"
+BUDGET_MS = 100
+
+PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    f"import {MODULE}\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed * 1000, 'matplotlib' in sys.modules)\n"
+)
+
+
+def measure(runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+        ).stdout.split()
+        if output[1] == "True":
+            raise SystemExit(f"FAIL: importing {MODULE} loaded matplotlib")
+        timings.append(float(output[0]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = measure(args.runs)
+    best = min(timings)
+    print(f"{MODULE}: best {best:.1f} ms, worst {max(timings):.1f} ms over {args.runs} runs "
+          f"(budget {args.budget_ms:.0f} ms)")
+    if best > args.budget_ms:
+        raise SystemExit(f"FAIL: cold import took {best:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Bytes per patient of the slotted Patient/ScalePatient against the previous
+per-instance __dict__ layout.
+
+    python benchmarks/memory_per_patient.py [--count 100000]
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agernatura_project.patient import Patient, ScalePatient  # noqa: E402
+
+
+class DictRecord:
+    # Same attributes stored in a per-instance __dict__, as before __slots__.
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def patient_fields(i):
+    return dict(name=f"Nombre{i}", surname=f"Apellido{i}", age=20 + i % 60, gender="m",
+                height=150.0 + i % 40, weight=50.0 + i % 50, activity="activo",
+                waist_circunference=70.0 + i % 40)
+
+
+def scale_fields(i):
+    return dict(mgras_percent=10.0 + i % 30, bone_mass=2.0 + i % 3, muscular_mass_kg=30.0 + i % 20,
+                imc=18.0 + i % 20, metabolic_age=20.0 + i % 50, visceral_gras=float(i % 20),
+                water_levels=40.0 + i % 30)
+
+
+def measure(build, count):
+    # Field values are created outside the traced section so only the record
+    # containers are counted.
+    fields = [build.fields(i) for i in range(count)]
+    tracemalloc.start()
+    records = [build(**f) for f in fields]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size / count
+
+
+def builder(factory, fields, patient_id=False):
+    def build(**f):
+        record = factory(**f)
+        if patient_id:
+            record.patient_id = "001"
+        return record
+    build.fields = fields
+    return build
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    both = lambda i: {**patient_fields(i), **scale_fields(i)}  # noqa: E731
+    rows = [
+        ("Patient", builder(DictRecord, patient_fields, True), builder(Patient, patient_fields)),
+        ("ScalePatient", builder(DictRecord, both, True), builder(ScalePatient, both)),
+    ]
+    print(f"{'class':<14}{'__dict__ B/patient':>20}{'__slots__ B/patient':>21}{'saved':>8}")
+    for name, before, after in rows:
+        dict_size = measure(before, args.count)
+        slot_size = measure(after, args.count)
+        print(f"{name:<14}{dict_size:>20.0f}{slot_size:>21.0f}{1 - slot_size / dict_size:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()